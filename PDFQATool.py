@@ -1,93 +1,1449 @@
-import os
-from typing import Type, List
-from pydantic import BaseModel, Field
-from urllib.parse import urlparse
-from mistralai import Mistral
-from crewai.tools import BaseTool
-from dotenv import load_dotenv
-
-load_dotenv()
-
-class PDFQAToolInput(BaseModel):
-    """Accepts 1–10 PDF or image paths/URLs plus a question."""
-    paths: List[str] = Field(
-        ..., 
-        description="List of local filesystem paths or public URLs to up to 10 PDF or image files (PDF, JPG, JPEG, PNG)",
-        max_items=10
-    )
-    question: str = Field(
-        ..., 
-        description="The crew agent’s question to answer using the provided files"
-    )
-
-class PDFQATool(BaseTool):
-    name: str = "PDFQATool"
-    description: str = (
-        "Uploads scanned PDFs or images (JPG, JPEG, PNG) to Mistral, retrieves signed HTTPS URLs, "
-        "and answers a question across all of them in one go."
-    )
-    args_schema: Type[PDFQAToolInput] = PDFQAToolInput
-
-    def _run(self, paths, question) -> str:
-        # 1. Initialize SDK client
-        api_key = os.getenv("MISTRAL_API_KEY")
-        if not api_key:
-            raise ValueError("MISTRAL_API_KEY must be set in the environment")
-        client = Mistral(api_key=api_key)
-
-        # 2. Validate file types
-        supported_extensions = {'.pdf', '.jpg', '.jpeg', '.png'}
-        
-        content_chunks = [{"type": "text", "text": question}]
-        for path in paths:
-            parsed = urlparse(path)
-            is_url = parsed.scheme in ("http", "https")
-            if is_url:
-                # Extract extension from URL
-                ext = os.path.splitext(parsed.path)[1].lower()
-            else:
-                # Extract extension from local path
-                ext = os.path.splitext(path)[1].lower()
-            
-            if ext not in supported_extensions:
-                raise ValueError(f"Unsupported file type: {ext}. Supported types: {', '.join(supported_extensions)}")
-
-            # 3. Handle local files (upload) or URLs
-            if is_url:
-                url_ref = path
-            else:
-                # Upload local file for OCR processing
-                with open(path, "rb") as f:
-                    file_content = f.read()
-                upload_resp = client.files.upload(
-                    file={
-                        "file_name": os.path.basename(path),
-                        "content": file_content
-                    },
-                    purpose="ocr"
-                )
-                # Get a signed HTTPS URL
-                url_ref = client.files.get_signed_url(file_id=upload_resp.id).url
-
-            # 4. Add to content chunks based on file type
-            if ext == '.pdf':
-                content_chunks.append({
-                    "type": "document_url",
-                    "document_url": url_ref
-                })
-            else:  # Image formats: .jpg, .jpeg, .png
-                content_chunks.append({
-                    "type": "image_url",
-                    "image_url": url_ref
-                })
-
-        # 5. Ask the model, which OCRs & understands all files at once
-        chat_resp = client.chat.complete(
-            model="mistral-medium-latest",
-            messages=[{"role": "user", "content": content_chunks}],
-            temperature=0.0,
-        )
-
-        # 6. Return the aggregated answer
-        return chat_resp.choices[0].message.content
-
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generator, Type, List, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError, create_model, model_validator
+from urllib.parse import urlparse
+from crewai.tools import BaseTool
+from dotenv import load_dotenv
+from pdfqa_cache import AnswerCache, answer_cache, ocr_cache, sha256_bytes, single_flight, upload_cache
+from pdfqa_backend import get_backend
+from pdfqa_files import file_registry, file_sweeper
+from pdfqa_metrics import metrics
+from pdfqa_mirror import url_mirror
+from pdfqa_ocr import MistralOCREngine, OCREngine, TesseractOCREngine
+from pdfqa_preprocess import (
+    ImageOptions, can_split_pdf, extract_text_layer, page_digests, rank_pages, shrink_image, subset_pdf
+)
+from pdfqa_scheduler import CircuitOpenError, HedgePolicy, get_hedge_policy, get_scheduler
+
+load_dotenv()
+
+# Lifetime requested for signed URLs, in hours
+SIGNED_URL_EXPIRY_HOURS = 24
+
+# OCR-cache namespace for text extracted from PDFs' embedded text layer
+TEXT_LAYER_CACHE_NAME = "pdf-text-layer"
+
+# OCR-cache namespace for each PDF's per-page content digests
+PAGE_DIGEST_CACHE_NAME = "pdf-page-digests"
+
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Upper bound on the locally extracted text returned while Mistral is unavailable, in characters
+OFFLINE_TEXT_LIMIT = 60000
+
+# Rough prompt-token cost of one document/image chunk, used to budget a call before it is sent
+TOKENS_PER_FILE_ESTIMATE = 1500
+
+
+def _estimate_tokens(content_chunks) -> int:
+    """Cheap upfront guess (~4 characters per token) for the scheduler's tokens-per-minute budget."""
+    estimate = 0
+    for chunk in content_chunks:
+        if chunk["type"] == "text":
+            estimate += len(chunk["text"]) // 4
+        else:
+            estimate += TOKENS_PER_FILE_ESTIMATE
+    return estimate
+
+
+def _hedge_key(model: str, estimated_tokens: int) -> str:
+    """Latency history key: the model plus the prompt size rounded up to a power of two."""
+    return f"{model}:{1 << max(0, estimated_tokens - 1).bit_length()}"
+
+
+@dataclass
+class _Document:
+    """One input file: where it came from, its type and, for local files, its bytes and hash."""
+    path: str
+    ext: str
+    is_url: bool
+    content: Optional[bytes] = None
+    digest: Optional[str] = None
+
+    @property
+    def cache_key(self) -> str:
+        return f"url:{self.path}" if self.is_url else self.digest
+
+    @property
+    def display_name(self) -> str:
+        return os.path.basename(urlparse(self.path).path)
+
+
+def _batch_items(question, questions, fields) -> Optional[Dict[str, str]]:
+    """Map of result key -> question text for a batch call, or None for a single question."""
+    if not (questions or fields):
+        return None
+    items = {}
+    if question:
+        items[question] = question
+    for q in questions or []:
+        items[q] = q
+    for field_name, field_description in (fields or {}).items():
+        items[field_name] = f"{field_name}: {field_description}"
+    return items
+
+
+def _batch_prompt(pending: Dict[str, str]):
+    # Short ids keep the model from paraphrasing long questions into different JSON keys
+    ids = {f"q{number}": key for number, key in enumerate(pending, start=1)}
+    prompt = "\n".join(
+        ["Answer each question below using the documents. Reply with a single JSON object "
+         "whose keys are exactly the question ids and whose values are the answers. "
+         "Use null when the documents do not contain the answer."]
+        + [f"{question_id}: {pending[key]}" for question_id, key in ids.items()]
+    )
+    return ids, prompt
+
+
+def _parse_json_answer(raw_answer: str, context: str) -> dict:
+    try:
+        return json.loads(raw_answer)
+    except ValueError:
+        raise ValueError(f"Model returned invalid JSON {context}: {raw_answer[:200]}")
+
+
+def _document_details(documents) -> List[dict]:
+    return [
+        {"name": d.display_name, "digest": d.digest[:16] if d.digest else None, "bytes": len(d.content or b"")}
+        for d in documents
+    ]
+
+
+def _dedupe_documents(documents):
+    """
+    Documents with distinct content in first-seen order, and a map from each
+    kept path to the paths of identical copies dropped in its favour.
+    """
+    unique: Dict[str, _Document] = {}
+    duplicates: Dict[str, List[str]] = {}
+    for document in documents:
+        kept = unique.setdefault(document.cache_key, document)
+        if kept is not document:
+            duplicates.setdefault(kept.path, []).append(document.path)
+    return list(unique.values()), duplicates
+
+
+def _with_duplicates(result: str, duplicates: Dict[str, List[str]], structured: bool) -> str:
+    """
+    A free-text answer followed by the duplicate-path map. Structured (JSON)
+    results are returned untouched; the map is in the call's metrics record.
+    """
+    if not duplicates or structured:
+        return result
+    return (
+        f"{result}\n\nIdentical files were processed once, under the first path "
+        f"(kept path -> duplicate paths):\n{json.dumps(duplicates, indent=2)}"
+    )
+
+
+# Questions asking for reasoning rather than lookup always go to the top model tier
+_REASONING_QUESTION = re.compile(
+    r"\b(why|explain|assess|evaluate|compare|analy[sz]e|summari[sz]e|calculate|recommend|decide|justify)", re.I
+)
+SIMPLE_QUESTION_MAX_WORDS = 30
+
+CONFIDENCE_CHUNK = {
+    "type": "text",
+    "text": (
+        "After your answer, add a final line that is exactly 'CONFIDENCE: high' or 'CONFIDENCE: low'. "
+        "Use low if the documents do not clearly contain the answer or you are unsure."
+    ),
+}
+_CONFIDENCE_LINE = re.compile(r"\s*\**CONFIDENCE:\s*(high|medium|low)\W*$", re.I)
+
+
+def _is_simple_question(question: str) -> bool:
+    """Short lookup/classification questions a smaller model can answer ("is this a passport?")."""
+    return len(question.split()) <= SIMPLE_QUESTION_MAX_WORDS and not _REASONING_QUESTION.search(question)
+
+
+def _split_confidence(raw_answer: str):
+    """(answer without the confidence line, whether the model was confident). A missing line counts as unsure."""
+    match = _CONFIDENCE_LINE.search(raw_answer)
+    if match is None:
+        return raw_answer.strip(), False
+    return raw_answer[:match.start()].strip(), match.group(1).lower() == "high"
+
+
+def _confidence_free_length(text: str) -> int:
+    """Length of the prefix of a streamed reply that cannot be part of its trailing confidence line."""
+    match = _CONFIDENCE_LINE.search(text)
+    if match is not None:
+        return match.start()
+    # The last line may still grow into "CONFIDENCE: ..."
+    tail_start = text.rfind("\n") + 1
+    tail = text[tail_start:].lstrip(" *").upper()
+    if "CONFIDENCE:".startswith(tail[:len("CONFIDENCE:")]):
+        return tail_start
+    return len(text)
+
+
+def _parse_batch_answer(raw_answer: str, context: str = "for a batch question") -> dict:
+    parsed = _parse_json_answer(raw_answer, context)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Model returned {type(parsed).__name__} instead of a JSON object {context}")
+    return parsed
+
+
+def _usage_amounts(chat_resp) -> Dict[str, int]:
+    """Prompt/completion token counts reported in ``chat_resp.usage``, for the metrics registry."""
+    usage = getattr(chat_resp, "usage", None)
+    return {
+        name: getattr(usage, name)
+        for name in ("prompt_tokens", "completion_tokens")
+        if isinstance(getattr(usage, name, None), int)
+    }
+
+
+class _StreamProgress:
+    """
+    Accumulates a streamed completion, forwarding text deltas and timing the first one.
+    With ``hold_back_confidence`` the trailing "CONFIDENCE: ..." line is never forwarded.
+    """
+
+    def __init__(self, callback: Callable[[str], None], hold_back_confidence: bool = False):
+        self.callback = callback
+        self.hold_back_confidence = hold_back_confidence
+        self.parts: List[str] = []
+        self.usage = None
+        self._started = time.perf_counter()
+        self._first_token_seen = False
+        self._forwarded = 0
+
+    def add(self, chunk) -> None:
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        for choice in chunk.choices or []:
+            delta = choice.delta.content
+            if not isinstance(delta, str) or not delta:
+                continue
+            if not self._first_token_seen:
+                self._first_token_seen = True
+                metrics.record("first_token", time.perf_counter() - self._started)
+            self.parts.append(delta)
+            if not self.hold_back_confidence:
+                self.callback(delta)
+                continue
+            text = self.text()
+            forwardable = _confidence_free_length(text)
+            if forwardable > self._forwarded:
+                self.callback(text[self._forwarded:forwardable])
+                self._forwarded = forwardable
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def usage_amounts(self) -> Dict[str, int]:
+        return _usage_amounts(self)
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        return getattr(self.usage, "total_tokens", None)
+
+
+@functools.lru_cache(maxsize=None)
+def _nullable_schema(schema: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    ``schema`` with every top-level field nullable, for the response format only,
+    so the model can say a value is missing instead of being forced to invent one.
+    """
+    fields = {
+        name: (Optional[field.annotation], Field(..., description=field.description))
+        for name, field in schema.model_fields.items()
+    }
+    return create_model(schema.__name__, **fields)
+
+
+def _schema_response_format(schema: Type[BaseModel]) -> dict:
+    """Structured-output response format constraining the completion to ``schema`` (with nullable fields)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.__name__,
+            "schema_definition": _nullable_schema(schema).model_json_schema(),
+            "strict": True,
+        },
+    }
+
+
+def _schema_parser(schema: Type[BaseModel]) -> Callable[[str], BaseModel]:
+    """
+    Validates a reply against the real ``schema``: nulls fall back to field
+    defaults, so a missing required value fails validation (and is retried or
+    escalated) rather than passing as "" or 0.
+    """
+    def parse(raw_answer: str) -> BaseModel:
+        data = _parse_json_answer(raw_answer, f"for {schema.__name__}")
+        if isinstance(data, dict):
+            data = {
+                name: value for name, value in data.items()
+                if not (value is None and name in schema.model_fields and not schema.model_fields[name].is_required())
+            }
+        return schema.model_validate(data)
+    return parse
+
+
+def _missing_fields_error(schema: Type[BaseModel], error: ValidationError) -> ValueError:
+    """Final extraction failure, naming the fields the documents did not supply."""
+    missing = sorted({
+        ".".join(str(part) for part in detail["loc"])
+        for detail in error.errors()
+        if detail["type"] == "missing" or detail.get("input", "") is None
+    })
+    if not missing:
+        return ValueError(f"Could not extract a valid {schema.__name__} record: {error}")
+    return ValueError(
+        f"Could not find {', '.join(missing)} for {schema.__name__} in the documents. "
+        "Ask for these fields with natural-language questions instead."
+    )
+
+
+def _schema_prompt(schema: Type[BaseModel]) -> str:
+    lines = [
+        f"Extract a {schema.__name__} record from the documents and reply with one JSON object "
+        "matching the response schema. Use the values exactly as the documents state them. "
+        "If a value is not in the documents, set it to null instead of guessing, and note it "
+        "in a discrepancies/issues list if the schema has one.",
+        "Fields:",
+    ]
+    for field_name, field in schema.model_fields.items():
+        lines.append(f"- {field_name}: {field.description or field_name}")
+    return "\n".join(lines)
+
+
+def _validation_retry_chunk(raw_answer: str, error: ValueError) -> dict:
+    """Follow-up text telling the model why its previous reply was rejected."""
+    return {
+        "type": "text",
+        "text": (
+            f"Your previous reply did not validate against the schema:\n{error}\n\n"
+            f"Previous reply:\n{raw_answer[:2000]}\n\nReply again with the corrected JSON object only."
+        ),
+    }
+
+
+def _schema_cache_text(schema: Type[BaseModel]) -> str:
+    """Stands in for the question in cache keys, so editing a schema never serves stale records."""
+    return json.dumps(schema.model_json_schema(), sort_keys=True)
+
+
+def _reduce_chunks(shards, partial_answers, question) -> list:
+    """Text-only message asking the model to merge per-shard answers into one."""
+    sections = [
+        f"The question below was answered separately for {len(shards)} groups of documents "
+        "belonging to the same application. Combine the partial answers into one complete "
+        "answer, resolving overlaps and keeping every distinct fact."
+    ]
+    for number, (shard, partial_answer) in enumerate(zip(shards, partial_answers), start=1):
+        names = ", ".join(d.display_name for d in shard)
+        sections.append(f"=== Group {number} ({names}) ===\n{partial_answer}")
+    sections.append(f"Question: {question}")
+    return [{"type": "text", "text": "\n\n".join(sections)}]
+
+
+def _merge_partial_results(items, partial_results):
+    """Keys answered by one group (or identically by all) are final; the rest are returned as conflicts."""
+    results, conflicts = {}, {}
+    for key in items:
+        found = [partial[key] for partial in partial_results if partial.get(key) is not None]
+        distinct = [value for i, value in enumerate(found) if value not in found[:i]]
+        if len(distinct) > 1:
+            conflicts[key] = distinct
+        else:
+            results[key] = distinct[0] if distinct else None
+    return results, conflicts
+
+
+def _conflict_prompt(items, conflicts):
+    ids = {f"q{number}": key for number, key in enumerate(conflicts, start=1)}
+    prompt = "\n\n".join(
+        ["Several groups of documents from the same application gave different answers "
+         "to the questions below. Reply with a single JSON object mapping each question id "
+         "to its combined answer (merge complementary values, prefer the most complete and recent one)."]
+        + [f"{question_id}: {items[key]}\nAnswers: {json.dumps(conflicts[key])}" for question_id, key in ids.items()]
+    )
+    return ids, prompt
+
+
+def _resolve_conflicts(merged: dict, ids, conflicts, results) -> None:
+    for question_id, key in ids.items():
+        results[key] = merged.get(question_id, conflicts[key][0])
+
+
+def _text_chunks(documents, all_pages, prompt, selections) -> list:
+    """
+    A single text chunk holding the OCR text of every document followed by the
+    question(s). ``selections`` holds, per document, the page indices to include
+    (None for all of them).
+    """
+    sections = ["Use only the documents below."]
+    for number, (document, pages, selected) in enumerate(zip(documents, all_pages, selections), start=1):
+        header = f"=== Document {number}: {document.display_name} ==="
+        if selected is not None:
+            header += f"\n(Only the {len(selected)} of {len(pages)} pages relevant to the question are shown.)"
+        sections.append(header)
+        for index in (selected if selected is not None else range(len(pages))):
+            sections.append(f"--- Page {index + 1} ---\n{pages[index]}")
+    sections.append(prompt)
+    return [{"type": "text", "text": "\n\n".join(sections)}]
+
+
+def _pending_uploads(planned) -> List[_Document]:
+    """Documents referenced by the URL chunks of planned document parts, in message order."""
+    return [chunk[chunk["type"]] for chunks in planned for chunk in chunks if chunk["type"] != "text"]
+
+
+def _document_chunks(prompt, planned, url_refs) -> list:
+    """Prompt followed by every planned chunk, with documents replaced by their signed URLs."""
+    url_refs = iter(url_refs)
+    content_chunks = [{"type": "text", "text": prompt}]
+    for chunks in planned:
+        for chunk in chunks:
+            if chunk["type"] != "text":
+                chunk = {"type": chunk["type"], chunk["type"]: next(url_refs)}
+            content_chunks.append(chunk)
+    return content_chunks
+
+
+def _in_context(fn):
+    """Wrap ``fn`` to run in a copy of the caller's context, so worker threads report metrics to the same call."""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(fn, *args)
+
+
+async def _to_thread(fn, *args):
+    """Run blocking work (file reads, PDF parsing, image encoding) off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(_in_context(fn), *args))
+
+
+async def _gather_bounded(coros, limit: int) -> list:
+    """
+    Await ``coros`` concurrently, at most ``limit`` at a time, returning results
+    in order. If one fails or the caller is cancelled, the rest are cancelled.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def bounded(coro):
+        try:
+            async with semaphore:
+                return await coro
+        finally:
+            # Silences "never awaited" warnings for coroutines cancelled before they started
+            coro.close()
+
+    tasks = [asyncio.ensure_future(bounded(coro)) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class _IO:
+    """
+    One operation yielded by a step generator: ``run`` performs it in the
+    calling thread, ``arun`` returns an awaitable doing the same on the event loop.
+    """
+
+    def __init__(self, run: Callable[[], Any], arun: Callable[[], Awaitable]):
+        self.run = run
+        self.arun = arun
+
+
+def _io(sync_fn, async_fn, *args, **kwargs) -> _IO:
+    return _IO(functools.partial(sync_fn, *args, **kwargs), functools.partial(async_fn, *args, **kwargs))
+
+
+def _blocking(fn, *args) -> _IO:
+    """File reads, PDF parsing, image encoding: run inline, or off the event loop when async."""
+    return _IO(functools.partial(fn, *args), functools.partial(_to_thread, fn, *args))
+
+
+def _scheduled(sync_fn, async_fn, *args, **kwargs) -> _IO:
+    """A provider call through the shared scheduler (rate limits, retries, circuit breaker)."""
+    scheduler = get_scheduler()
+    return _IO(
+        functools.partial(scheduler.call, sync_fn, *args, **kwargs),
+        functools.partial(scheduler.acall, async_fn, *args, **kwargs),
+    )
+
+
+def _blocking_steps(fn, *args):
+    return (yield _blocking(fn, *args))
+
+
+class _Each:
+    """
+    Runs ``steps(item)`` for every item concurrently, at most ``limit`` at a
+    time, and yields their results in order: on a thread pool, or as tasks.
+    """
+
+    def __init__(self, steps: Callable[[Any], Generator], items, limit: int):
+        self.steps = steps
+        self.items = list(items)
+        self.limit = limit
+
+    def run(self) -> list:
+        workers = max(1, min(self.limit, len(self.items)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_in_context(lambda item: _drive(self.steps(item))), self.items))
+
+    def arun(self) -> Awaitable[list]:
+        return _gather_bounded([_adrive(self.steps(item)) for item in self.items], self.limit)
+
+
+def _drive(steps: Generator):
+    """
+    Run a step generator synchronously. Each yielded operation's result (or
+    exception) is sent back into the generator; its return value is returned.
+    """
+    send, value = steps.send, None
+    while True:
+        try:
+            operation = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = steps.send, operation.run()
+        except BaseException as exc:
+            send, value = steps.throw, exc
+
+
+async def _adrive(steps: Generator):
+    """``_drive`` on the event loop: operations are awaited, so cancellation unwinds the generator too."""
+    send, value = steps.send, None
+    while True:
+        try:
+            operation = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = steps.send, await operation.arun()
+        except BaseException as exc:
+            send, value = steps.throw, exc
+
+
+def _read_stream(event_stream, progress: "_StreamProgress") -> None:
+    with event_stream:
+        for event in event_stream:
+            progress.add(event.data)
+
+
+async def _aread_stream(opening: Awaitable, progress: "_StreamProgress") -> None:
+    event_stream = await opening
+    async with event_stream:
+        async for event in event_stream:
+            progress.add(event.data)
+
+
+class PDFQAToolInput(BaseModel):
+    """Accepts PDF or image paths/URLs plus a question, a list of questions, or a field schema."""
+    paths: List[str] = Field(
+        ..., 
+        description=(
+            "List of local filesystem paths or public URLs to PDF or image files (PDF, JPG, JPEG, PNG). "
+            "Pass all files at once; large sets are split and queried in parallel automatically"
+        ),
+        min_items=1
+    )
+    question: Optional[str] = Field(
+        None,
+        description="The crew agent’s question to answer using the provided files"
+    )
+    questions: Optional[List[str]] = Field(
+        None,
+        description="Several questions to answer in a single pass over the files; answers are returned as JSON keyed by question"
+    )
+    fields: Optional[Dict[str, str]] = Field(
+        None,
+        description="Fields to extract in a single pass, as {field_name: description}; values are returned as JSON keyed by field name"
+    )
+    schema_name: Optional[str] = Field(
+        None,
+        description=(
+            "Name of a registered output schema (e.g. 'ApplicantData') to extract; the result is a JSON "
+            "object already validated against that schema"
+        )
+    )
+
+    @model_validator(mode="after")
+    def _require_a_question(self):
+        if not (self.question or self.questions or self.fields or self.schema_name):
+            raise ValueError("Provide a question, a list of questions, fields to extract, or a schema name")
+        return self
+
+class PDFQATool(BaseTool):
+    name: str = "PDFQATool"
+    description: str = (
+        "Reads scanned PDFs or images (JPG, JPEG, PNG) with Mistral OCR and answers a question "
+        "across all of them in one go. Pass `questions` or `fields` instead to extract several "
+        "values at once; they are returned together as JSON. Pass `schema_name` to get a whole "
+        "record (e.g. ApplicantData) back as JSON validated against that schema."
+    )
+    args_schema: Type[PDFQAToolInput] = PDFQAToolInput
+    max_concurrent_uploads: int = Field(
+        default=int(os.getenv("PDFQA_MAX_CONCURRENT_UPLOADS", "4")),
+        description="Upper bound on files uploaded and signed in parallel within one call"
+    )
+    max_files_per_call: int = Field(
+        default=10,
+        description="Larger file sets are sharded into groups of this size, queried concurrently and merged"
+    )
+    max_concurrent_shards: int = 8
+    model: str = "mistral-medium-latest"
+    temperature: float = 0.0
+    use_answer_cache: bool = Field(
+        default=True,
+        description="Reuse earlier answers to the same question over the same file contents"
+    )
+    qa_mode: Literal["text", "document"] = Field(
+        default=os.getenv("PDFQA_QA_MODE", "text"),
+        description=(
+            "'text' OCRs each document once and answers over the cached page markdown; "
+            "'document' sends the files themselves to the model on every question"
+        )
+    )
+    ocr_engine: OCREngine = Field(default_factory=MistralOCREngine, exclude=True)
+    image_options: Optional[ImageOptions] = Field(
+        default_factory=ImageOptions,
+        description="Downscaling/recompression applied to images before upload; None uploads them as-is"
+    )
+    use_text_layer: bool = Field(
+        default=True,
+        description="Read digitally generated PDF pages from their text layer and OCR only scanned pages"
+    )
+    max_relevant_pages: Optional[int] = Field(
+        default=int(os.getenv("PDFQA_MAX_RELEVANT_PAGES", "6")),
+        description=(
+            "Longer documents are pruned to the pages that best match the question, scored on "
+            "their text layer or cached OCR text; None always sends every page"
+        )
+    )
+
+    output_schemas: Dict[str, Type[BaseModel]] = Field(
+        default_factory=dict,
+        exclude=True,
+        description="Pydantic models the agent can request by name through `schema_name`"
+    )
+    prefetch_urls: bool = Field(
+        default=os.getenv("PDFQA_PREFETCH_URLS", "false").lower() in ("1", "true", "yes"),
+        description=(
+            "Document mode: download http(s) documents into a local mirror (revalidated with "
+            "ETag/Last-Modified) and treat them like local files, instead of letting the model fetch the "
+            "URL on every question. Text mode always mirrors them, since it caches their OCR text"
+        )
+    )
+    stream_callback: Optional[Callable[[str], None]] = Field(
+        default=None,
+        exclude=True,
+        description=(
+            "If set, answers to single questions are streamed and each piece of text is passed to "
+            "this callback as it arrives; the tool still returns the full answer"
+        )
+    )
+    model_tiers: List[str] = Field(
+        default_factory=lambda: [
+            name.strip() for name in os.getenv("PDFQA_MODEL_TIERS", "mistral-small-latest").split(",") if name.strip()
+        ],
+        description=(
+            "Cheaper models tried in order before `model` for simple questions and structured "
+            "extraction; a reply escalates to the next tier when it fails validation or reports low confidence"
+        )
+    )
+    fallback_ocr_engine: Optional[OCREngine] = Field(
+        default_factory=lambda: TesseractOCREngine() if TesseractOCREngine.available() else None,
+        exclude=True,
+        description=(
+            "Local engine used while the Mistral circuit breaker is open; the tool then returns the "
+            "extracted text for the calling agent to answer from"
+        )
+    )
+    hedge_policy: Optional[HedgePolicy] = Field(
+        default_factory=get_hedge_policy,
+        exclude=True,
+        description=(
+            "Sends a duplicate completion when one runs past a latency percentile and keeps the first "
+            "reply; None (the default unless PDFQA_HEDGE_PERCENTILE is set) disables hedging"
+        )
+    )
+    max_validation_retries: int = Field(
+        default=1,
+        description="Times a structured extraction is re-asked, with the validation errors, before failing"
+    )
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def model_post_init(self, __context) -> None:
+        super().model_post_init(__context)
+        # Files left by earlier runs are collected even if this process only ever hits the cache
+        file_sweeper.start()
+
+    def extract(self, paths: List[str], schema: Type[BaseModel]) -> BaseModel:
+        """Extract one ``schema`` record from the files and return it as a validated object."""
+        return _drive(self._extract_call_steps(paths, schema))
+
+    async def aextract(self, paths: List[str], schema: Type[BaseModel]) -> BaseModel:
+        return await _adrive(self._extract_call_steps(paths, schema))
+
+    def _run(self, paths, question=None, questions=None, fields=None, schema_name=None) -> str:
+        return _drive(self._call_steps(paths, question, questions, fields, schema_name))
+
+    async def _arun(self, paths, question=None, questions=None, fields=None, schema_name=None) -> str:
+        """
+        Async counterpart of ``_run`` built on the backend's async operations.
+
+        File reads, uploads, OCR and completions run concurrently on the event
+        loop; cancelling the call cancels everything still in flight.
+        """
+        return await _adrive(self._call_steps(paths, question, questions, fields, schema_name))
+
+    # The tool's logic is written once, as generators ("steps") that yield every
+    # blocking or awaitable operation (_IO, _Each). _drive performs them in the
+    # calling thread for _run, _adrive awaits them for _arun.
+
+    def _call_steps(self, paths, question, questions, fields, schema_name):
+        # Bytes, latencies and tokens of everything below are summed into one metrics record
+        with metrics.track_call(**self._call_details(paths, question, questions, fields, schema_name)) as call, \
+                file_registry.track():
+            # 1. Validate file types and hash local files before any network work
+            documents = yield from self._read_steps(paths)
+            # Re-saved copies of the same upload are sent once
+            documents, duplicates = self._drop_duplicates(documents, call)
+
+            # 2. Identical calls already in flight share one set of uploads and completions
+            schema = self._output_schema(schema_name) if schema_name else None
+            items = _batch_items(question, questions, fields)
+            key = self._flight_key(documents, question, items, schema)
+            answer_steps = functools.partial(self._answer_call_steps, documents, question, items, schema)
+            result, shared = yield _IO(
+                lambda: single_flight.do(key, lambda: _drive(answer_steps())),
+                lambda: single_flight.ado(key, lambda: _adrive(answer_steps())),
+            )
+            self._record_flight(shared)
+            call.details["coalesced"] = shared
+            return _with_duplicates(result, duplicates, structured=schema is not None or items is not None)
+
+    def _extract_call_steps(self, paths, schema: Type[BaseModel]):
+        documents = yield from self._read_steps(paths)
+        return (yield from self._extract_steps(_dedupe_documents(documents)[0], schema))
+
+    def _read_steps(self, paths):
+        documents = self._describe_documents(paths)
+        yield _Each(
+            lambda document: _blocking_steps(self._read_document, document), documents, self.max_concurrent_uploads
+        )
+        return documents
+
+    def _answer_call_steps(self, documents, question, items, schema):
+        try:
+            # A registered schema is extracted with structured output and returned already validated
+            if schema is not None:
+                record = yield from self._extract_steps(documents, schema)
+                return record.model_dump_json(indent=2)
+            # Several questions or fields are answered together in one completion
+            if items is not None:
+                return json.dumps((yield from self._batch_steps(documents, items)), indent=2)
+            return (yield from self._answer_steps(documents, question))
+        except Exception:
+            # Mistral is down: hand the locally extracted text to the crew's own LLM instead of failing
+            if not get_scheduler().breaker.is_open:
+                raise
+            return (yield _blocking(self._offline_answer, documents, question, items, schema))
+
+    def _call_details(self, paths, question, questions, fields, schema_name) -> dict:
+        """What a call asked, for its metrics record."""
+        return {
+            "paths": list(paths),
+            "question": question,
+            "questions": questions,
+            "fields": sorted(fields) if fields else None,
+            "schema_name": schema_name,
+            "qa_mode": self.qa_mode,
+            "model": self.model,
+        }
+
+    @staticmethod
+    def _drop_duplicates(documents, call):
+        unique, duplicates = _dedupe_documents(documents)
+        call.details["documents"] = _document_details(unique)
+        if duplicates:
+            call.details["duplicates"] = duplicates
+            metrics.increment("pdfqa.documents.deduplicated", len(documents) - len(unique))
+        return unique, duplicates
+
+    def _flight_key(self, documents, question, items, schema) -> str:
+        """Identifies calls that would produce the same result: same files, questions and settings."""
+        if schema is not None:
+            focus = _schema_cache_text(schema)
+        elif items is not None:
+            focus = json.dumps(items, sort_keys=True)
+        else:
+            focus = question
+        return AnswerCache.make_key(
+            [d.cache_key for d in documents], focus, self._model_signature(), self.temperature,
+            f"{self.qa_mode}+flight:{self._content_signature()}"
+        )
+
+    @staticmethod
+    def _record_flight(shared: bool) -> None:
+        metrics.increment("pdfqa.singleflight.coalesced" if shared else "pdfqa.singleflight.executed")
+
+    def _describe_documents(self, paths) -> List[_Document]:
+        supported_extensions = {'.pdf', '.jpg', '.jpeg', '.png'}
+
+        documents = []
+        for path in paths:
+            parsed = urlparse(path)
+            is_url = parsed.scheme in ("http", "https")
+            if is_url:
+                # Extract extension from URL
+                ext = os.path.splitext(parsed.path)[1].lower()
+            else:
+                # Extract extension from local path
+                ext = os.path.splitext(path)[1].lower()
+
+            if ext not in supported_extensions:
+                raise ValueError(f"Unsupported file type: {ext}. Supported types: {', '.join(supported_extensions)}")
+            documents.append(_Document(path=path, ext=ext, is_url=is_url))
+        return documents
+
+    def _read_document(self, document: _Document) -> None:
+        if document.is_url:
+            # Text mode caches OCR output, so remote documents are always mirrored and keyed by content
+            if not self.prefetch_urls and self.qa_mode != "text":
+                return
+            # A mirrored URL is handled exactly like a local file from here on
+            document.content = url_mirror.fetch(document.path)
+            document.is_url = False
+        else:
+            with open(document.path, "rb") as f:
+                document.content = f.read()
+        document.digest = sha256_bytes(document.content)
+
+    # --- Answering -----------------------------------------------------------
+
+    def _content_signature(self) -> str:
+        """Settings that change what the model is shown: page pruning, the text layer and the OCR engine."""
+        return f"{self.max_relevant_pages}:{self.use_text_layer}:{self.ocr_engine.name}"
+
+    def _answer_cache_key(self, documents, question, mode) -> Optional[str]:
+        if not self.use_answer_cache:
+            return None
+        return AnswerCache.make_key(
+            [d.cache_key for d in documents], question, self._model_signature(), self.temperature,
+            f"{mode}:{self._content_signature()}"
+        )
+
+    def _cached_answer(self, documents, question):
+        """(cache key, cached answer or None) for a single question."""
+        cache_key = self._answer_cache_key(documents, question, self.qa_mode)
+        cached_answer = answer_cache.get(cache_key) if cache_key is not None else None
+        self._record_cache_lookup(cache_key, cached_answer)
+        return cache_key, cached_answer
+
+    @staticmethod
+    def _record_cache_lookup(cache_key, cached_answer) -> None:
+        if cache_key is not None:
+            metrics.increment("pdfqa.answer_cache.hit" if cached_answer is not None else "pdfqa.answer_cache.miss")
+
+    def _answer_steps(self, documents, question, stream: bool = True):
+        # Serve repeated questions over the same contents from the answer cache
+        cache_key, cached_answer = self._cached_answer(documents, question)
+        if cached_answer is not None:
+            return cached_answer
+
+        # Shared provider backend (pooled Mistral SDK clients by default)
+        backend = get_backend()
+
+        if len(documents) > self.max_files_per_call:
+            # Map: answer per group of files, concurrently. Reduce: merge the partial answers.
+            shards = self._shards(documents)
+            partial_answers = yield _Each(
+                lambda shard: self._answer_steps(shard, question, stream=False), shards, self.max_concurrent_shards
+            )
+            content_chunks = _reduce_chunks(shards, partial_answers, question)
+        else:
+            # Build the message (cached OCR text, or the files themselves)
+            content_chunks = yield from self._content_chunks_steps(backend, documents, question)
+        # Only the answer the caller sees is streamed, never per-shard partials
+        answer = yield from self._complete_text_steps(backend, content_chunks, question, stream=stream)
+
+        if cache_key is not None:
+            answer_cache.put(cache_key, answer)
+        return answer
+
+    def _cached_batch(self, documents, items: Dict[str, str]):
+        """Split batch items into answers already cached and questions still pending."""
+        mode = f"{self.qa_mode}+batch"
+        results, cache_keys, pending = {}, {}, {}
+        for key, item_question in items.items():
+            cache_keys[key] = self._answer_cache_key(documents, item_question, mode)
+            cached_answer = answer_cache.get(cache_keys[key]) if cache_keys[key] else None
+            self._record_cache_lookup(cache_keys[key], cached_answer)
+            if cached_answer is not None:
+                results[key] = json.loads(cached_answer)
+            else:
+                pending[key] = item_question
+        return results, cache_keys, pending
+
+    @staticmethod
+    def _store_batch(parsed: dict, ids: Dict[str, str], results: dict, cache_keys: dict) -> None:
+        for question_id, key in ids.items():
+            results[key] = parsed.get(question_id)
+            if cache_keys[key] is not None and question_id in parsed:
+                answer_cache.put(cache_keys[key], json.dumps(results[key]))
+
+    def _batch_steps(self, documents, items: Dict[str, str]):
+        """
+        Answer several questions in one completion.
+
+        ``items`` maps the key reported back to the caller to the question text.
+        Each answer is cached on its own, so only questions never asked before
+        over these files reach the model.
+        """
+        if len(documents) > self.max_files_per_call:
+            return (yield from self._sharded_batch_steps(documents, items))
+
+        results, cache_keys, pending = self._cached_batch(documents, items)
+        if pending:
+            backend = get_backend()
+            ids, prompt = _batch_prompt(pending)
+            content_chunks = yield from self._content_chunks_steps(
+                backend, documents, prompt, focus=" ".join(pending.values())
+            )
+            parsed = yield from self._complete_structured_steps(
+                backend, content_chunks, JSON_RESPONSE_FORMAT, _parse_batch_answer,
+                complete=lambda answers: all(question_id in answers for question_id in ids),
+            )
+            self._store_batch(parsed, ids, results, cache_keys)
+
+        return {key: results.get(key) for key in items}
+
+    def _shards(self, documents) -> List[List[_Document]]:
+        size = max(1, self.max_files_per_call)
+        return [documents[i:i + size] for i in range(0, len(documents), size)]
+
+    def _sharded_batch_steps(self, documents, items: Dict[str, str]):
+        """
+        Batch questions over more files than fit in one call.
+
+        Values found in a single group are taken as-is; only keys answered
+        differently by several groups go through a reduce completion.
+        """
+        shards = self._shards(documents)
+        partial_results = yield _Each(
+            lambda shard: self._batch_steps(shard, items), shards, self.max_concurrent_shards
+        )
+
+        results, conflicts = _merge_partial_results(items, partial_results)
+        if conflicts:
+            ids, prompt = _conflict_prompt(items, conflicts)
+            raw_answer = yield from self._complete_steps(
+                get_backend(), [{"type": "text", "text": prompt}], response_format=JSON_RESPONSE_FORMAT
+            )
+            _resolve_conflicts(_parse_batch_answer(raw_answer, "while merging batch answers"), ids, conflicts, results)
+
+        return {key: results.get(key) for key in items}
+
+    # --- Structured extraction -----------------------------------------------
+
+    def _output_schema(self, schema_name: str) -> Type[BaseModel]:
+        try:
+            return self.output_schemas[schema_name]
+        except KeyError:
+            available = ", ".join(sorted(self.output_schemas)) or "none"
+            raise ValueError(f"Unknown schema '{schema_name}'; registered schemas: {available}")
+
+    def _cached_record(self, documents, schema):
+        """(cache key, cached record or None) for a structured extraction."""
+        cache_key = self._answer_cache_key(documents, _schema_cache_text(schema), f"{self.qa_mode}+schema")
+        cached_answer = answer_cache.get(cache_key) if cache_key is not None else None
+        self._record_cache_lookup(cache_key, cached_answer)
+        return cache_key, schema.model_validate_json(cached_answer) if cached_answer is not None else None
+
+    def _extract_steps(self, documents, schema: Type[BaseModel]):
+        cache_key, record = self._cached_record(documents, schema)
+        if record is not None:
+            return record
+
+        backend = get_backend()
+        prompt = _schema_prompt(schema)
+        if len(documents) > self.max_files_per_call:
+            # Shards answer in free text; the structured record is produced by the reduce step
+            shards = self._shards(documents)
+            partial_answers = yield _Each(
+                lambda shard: self._answer_steps(shard, prompt, stream=False), shards, self.max_concurrent_shards
+            )
+            content_chunks = _reduce_chunks(shards, partial_answers, prompt)
+        else:
+            content_chunks = yield from self._content_chunks_steps(backend, documents, prompt)
+
+        try:
+            record = yield from self._complete_structured_steps(
+                backend, content_chunks, _schema_response_format(schema), _schema_parser(schema),
+                retries=self.max_validation_retries,
+            )
+        except ValidationError as exc:
+            raise _missing_fields_error(schema, exc) from exc
+
+        if cache_key is not None:
+            answer_cache.put(cache_key, record.model_dump_json())
+        return record
+
+    # --- Model tiers ---------------------------------------------------------
+
+    def _lower_tiers(self, question: Optional[str] = None) -> List[str]:
+        """Cheaper models to try before ``model``; free-text questions only use them when simple."""
+        if question is not None and not _is_simple_question(question):
+            return []
+        return [name for name in self.model_tiers if name != self.model]
+
+    def _model_signature(self) -> str:
+        return "+".join(self._lower_tiers() + [self.model])
+
+    @staticmethod
+    def _record_tier(model: str) -> None:
+        metrics.increment(f"pdfqa.tier.{model}.answered")
+        metrics.annotate("answered_by", model)
+
+    @staticmethod
+    def _record_escalation(model: str) -> None:
+        metrics.increment(f"pdfqa.tier.{model}.escalated")
+        metrics.annotate("escalated_from", model)
+
+    def _complete_text_steps(self, backend, content_chunks, question, stream: bool = False):
+        """
+        Free-text answer from the cheapest tier that is confident in it, else from ``model``.
+        Every attempt is streamed; text from a tier that escalates has then already been shown.
+        """
+        for model in self._lower_tiers(question):
+            raw_answer = yield from self._complete_steps(
+                backend, content_chunks + [CONFIDENCE_CHUNK], stream=stream, model=model, confidence_line=True
+            )
+            answer, confident = _split_confidence(raw_answer)
+            if confident:
+                self._record_tier(model)
+                return answer
+            self._record_escalation(model)
+        self._record_tier(self.model)
+        return (yield from self._complete_steps(backend, content_chunks, stream=stream))
+
+    def _complete_structured_steps(self, backend, content_chunks, response_format, parse, retries: int = 0,
+                                   complete=None):
+        """
+        JSON reply passed through ``parse``, which raises ValueError (pydantic's
+        ValidationError is one) on a bad reply. Each lower tier gets one attempt and
+        escalates on a parse failure or when ``complete(result)`` is false; ``model``
+        gets ``retries`` further attempts, each told what was wrong.
+        """
+        for model in self._lower_tiers():
+            raw_answer = yield from self._complete_steps(backend, content_chunks, response_format, model=model)
+            try:
+                result = parse(raw_answer)
+            except ValueError:
+                result = None
+            if result is not None and (complete is None or complete(result)):
+                self._record_tier(model)
+                return result
+            self._record_escalation(model)
+
+        self._record_tier(self.model)
+        for attempt in range(retries + 1):
+            raw_answer = yield from self._complete_steps(backend, content_chunks, response_format)
+            try:
+                return parse(raw_answer)
+            except ValueError as exc:
+                if attempt == retries:
+                    raise
+                content_chunks = content_chunks + [_validation_retry_chunk(raw_answer, exc)]
+
+    # --- Completions ---------------------------------------------------------
+
+    def _completion_kwargs(self, content_chunks, response_format=None, model=None) -> dict:
+        kwargs = {
+            "model": model or self.model,
+            "messages": [{"role": "user", "content": content_chunks}],
+            "temperature": self.temperature,
+        }
+        if response_format:
+            kwargs["response_format"] = response_format
+        return kwargs
+
+    def _complete_steps(self, backend, content_chunks, response_format=None, stream: bool = False, model=None,
+                        confidence_line: bool = False):
+        if stream and self.stream_callback is not None:
+            return (yield from self._complete_streaming_steps(
+                backend, content_chunks, response_format, model, confidence_line
+            ))
+        scheduler = get_scheduler()
+        estimated_tokens = _estimate_tokens(content_chunks)
+        kwargs = self._completion_kwargs(content_chunks, response_format, model)
+        request = _scheduled(backend.complete, backend.acomplete, estimated_tokens=estimated_tokens, **kwargs)
+        with metrics.timed("completion") as amounts:
+            if self.hedge_policy is not None:
+                # A hedge policy races a duplicate request against unusually slow ones
+                hedge_key = _hedge_key(kwargs["model"], estimated_tokens)
+                request = _IO(
+                    functools.partial(self.hedge_policy.call, hedge_key, request.run),
+                    functools.partial(self.hedge_policy.acall, hedge_key, request.arun),
+                )
+            chat_resp = yield request
+            amounts.update(_usage_amounts(chat_resp))
+        usage = getattr(chat_resp, "usage", None)
+        scheduler.record_usage(estimated_tokens, getattr(usage, "total_tokens", None))
+        return chat_resp.choices[0].message.content
+
+    def _complete_streaming_steps(self, backend, content_chunks, response_format=None, model=None,
+                                  confidence_line: bool = False):
+        """
+        ``_complete_steps`` over ``backend.stream``: text is handed to ``stream_callback``
+        as it arrives and time-to-first-token is recorded apart from total latency.
+        Only opening the stream is retried; a stream that fails midway raises.
+        ``confidence_line`` keeps the reply's trailing confidence line from the callback.
+        """
+        opening = _scheduled(
+            backend.stream, backend.astream,
+            estimated_tokens=_estimate_tokens(content_chunks),
+            **self._completion_kwargs(content_chunks, response_format, model),
+        )
+        progress = _StreamProgress(self.stream_callback, hold_back_confidence=confidence_line)
+        with metrics.timed("completion") as amounts:
+            yield _IO(
+                lambda: _read_stream(opening.run(), progress),
+                lambda: _aread_stream(opening.arun(), progress),
+            )
+            amounts.update(progress.usage_amounts())
+        get_scheduler().record_usage(_estimate_tokens(content_chunks), progress.total_tokens)
+        return progress.text()
+
+    # --- Message content -----------------------------------------------------
+
+    def _content_chunks_steps(self, backend, documents, prompt, focus=None):
+        """
+        Message content for ``prompt`` over ``documents``. ``focus`` is the bare
+        question text used to pick relevant pages (defaults to the prompt).
+        """
+        focus = focus or prompt
+        limit = self.max_concurrent_uploads
+        if self.qa_mode == "text":
+            all_pages = yield _Each(lambda d: self._ocr_steps(backend, d), documents, limit)
+            selections = [self._relevant_pages(pages, focus) for pages in all_pages]
+            return _text_chunks(documents, all_pages, prompt, selections)
+
+        planned = yield _Each(lambda d: _blocking_steps(self._plan_document_parts, d, focus), documents, limit)
+        url_refs = yield _Each(lambda d: self._resolve_url_steps(backend, d), _pending_uploads(planned), limit)
+        return _document_chunks(prompt, planned, url_refs)
+
+    def _relevant_pages(self, page_texts, focus) -> Optional[List[int]]:
+        """Indices of the pages to send for ``focus``, or None to send the whole document."""
+        if not self.max_relevant_pages:
+            return None
+        return rank_pages(page_texts, focus, self.max_relevant_pages)
+
+    def _resolve_url_steps(self, backend, document: _Document):
+        if document.is_url:
+            return document.path
+        # Upload local file for OCR processing (once per unique content)
+        return (yield from self._upload_steps(backend, document))
+
+    def _plan_document_parts(self, document: _Document, focus: str) -> list:
+        """
+        Chunks for one file: its text layer as plain text where available, and a
+        document_url/image_url chunk for whatever still needs the model's OCR.
+        Long PDFs are trimmed to the pages relevant to ``focus`` first.
+        URL chunks hold the ``_Document`` to upload until ``_document_chunks`` fills them in.
+        """
+        text_layer = self._text_layer(document)
+        # Without pypdf the file cannot be split, so it is sent whole
+        if document.ext == ".pdf" and document.content is not None and can_split_pdf():
+            # Score pages on the text layer, or on OCR text cached by an earlier text-mode call
+            page_texts = ocr_cache.get(self._ocr_namespace(self.ocr_engine), document.cache_key) or text_layer
+            selected = self._relevant_pages(page_texts, focus) if page_texts else None
+        else:
+            selected = None
+        total_pages = len(text_layer) if text_layer else None
+
+        if text_layer:
+            chunks = []
+            keep = selected if selected is not None else range(len(text_layer))
+            text_pages = [f"--- Page {i + 1} ---\n{text_layer[i]}" for i in keep if text_layer[i] is not None]
+            scanned = [i for i in keep if text_layer[i] is None]
+            if text_pages:
+                chunks.append({
+                    "type": "text",
+                    "text": f"=== {document.display_name} (text layer) ===\n\n" + "\n\n".join(text_pages)
+                })
+            if scanned:
+                # Only the scanned pages are sent for OCR
+                chunks.append({
+                    "type": "document_url",
+                    "document_url": self._pages_document(document, scanned, total_pages)
+                })
+            return chunks
+
+        if document.ext == '.pdf':
+            return [{
+                "type": "document_url",
+                "document_url": self._pages_document(document, selected, total_pages) if selected else document
+            }]
+        # Image formats: .jpg, .jpeg, .png
+        return [{
+            "type": "image_url",
+            "image_url": document
+        }]
+
+    def _pages_document(self, document: _Document, page_indices: List[int], total_pages: Optional[int]) -> _Document:
+        """The document itself when every page is wanted, otherwise a PDF of just those pages."""
+        if total_pages is not None and len(page_indices) == total_pages:
+            return document
+        return self._page_subset(document, page_indices)
+
+    def _page_subset(self, document: _Document, page_indices: List[int]) -> _Document:
+        """A PDF of just ``page_indices``, keyed by its parent so the upload cache recognises it."""
+        label = ",".join(str(i + 1) for i in page_indices)
+        return _Document(
+            path=f"{os.path.splitext(document.path)[0]}_pages_{label.replace(',', '-')}.pdf",
+            ext=".pdf",
+            is_url=False,
+            content=subset_pdf(document.content, page_indices),
+            digest=sha256_bytes(f"{document.digest}#pages={label}".encode("utf-8")),
+        )
+
+    # --- OCR -----------------------------------------------------------------
+
+    def _text_layer(self, document: _Document) -> Optional[List[Optional[str]]]:
+        """Cached per-page text layer of a local PDF (None entries are scanned pages), or None."""
+        if not self.use_text_layer or document.ext != ".pdf" or document.content is None:
+            return None
+        pages = ocr_cache.get(TEXT_LAYER_CACHE_NAME, document.cache_key)
+        if pages is None:
+            # Unreadable PDFs are cached as [] so they are not re-parsed on every question
+            pages = extract_text_layer(document.content) or []
+            ocr_cache.put(TEXT_LAYER_CACHE_NAME, document.cache_key, pages)
+        return pages or None
+
+    def _page_digests(self, document: _Document) -> Optional[List[str]]:
+        """Cached per-page content digests of a local PDF, or None."""
+        if document.ext != ".pdf" or document.content is None:
+            return None
+        digests = ocr_cache.get(PAGE_DIGEST_CACHE_NAME, document.cache_key)
+        if digests is None:
+            digests = page_digests(document.content) or []
+            ocr_cache.put(PAGE_DIGEST_CACHE_NAME, document.cache_key, digests)
+        return digests or None
+
+    def _ocr_namespace(self, engine: OCREngine) -> str:
+        """
+        OCR cache namespace of whole documents. Pages read from the text layer are
+        cached apart from ``engine``'s own output; single pages (``put_page``) are
+        only ever the engine's and stay under its name.
+        """
+        return f"{engine.name}+{TEXT_LAYER_CACHE_NAME}" if self.use_text_layer else engine.name
+
+    def _ocr_plan(self, document: _Document, engine: Optional[OCREngine] = None):
+        """
+        (known, missing): ``known`` holds each page's text where the text layer or
+        an earlier OCR of the same page content supplies it (None elsewhere, or
+        None overall when the page count is unknown), and ``missing`` lists the
+        pages still to OCR (None means all, [] means the text is complete).
+        """
+        engine = engine or self.ocr_engine
+        pages = ocr_cache.get(self._ocr_namespace(engine), document.cache_key)
+        if pages is not None:
+            return pages, []
+
+        text_layer = self._text_layer(document)
+        digests = self._page_digests(document)
+        if text_layer:
+            known = list(text_layer)
+        elif digests:
+            known = [None] * len(digests)
+        else:
+            return None, None
+
+        if digests and len(digests) == len(known):
+            # Pages unchanged since an earlier version of this document was OCR'd
+            reused = 0
+            for index, text in enumerate(known):
+                if text is None:
+                    known[index] = ocr_cache.get_page(engine.name, digests[index])
+                    reused += known[index] is not None
+            metrics.increment("pdfqa.ocr.pages_reused", reused)
+
+        missing = [index for index, text in enumerate(known) if text is None]
+        if not missing:
+            ocr_cache.put(self._ocr_namespace(engine), document.cache_key, known)
+        return known, missing
+
+    def _store_ocr(self, document: _Document, known, missing, ocr_pages: List[str],
+                   engine: Optional[OCREngine] = None) -> List[str]:
+        """Merge OCR output for the ``missing`` pages into ``known`` and cache it per page and per document."""
+        engine = engine or self.ocr_engine
+        if known is None:
+            pages = ocr_pages
+            missing = range(len(ocr_pages))
+        else:
+            pages = list(known)
+            for index, text in zip(missing, ocr_pages):
+                pages[index] = text
+            pages = [text if text is not None else "" for text in pages]
+
+        digests = self._page_digests(document)
+        if digests and len(digests) == len(pages):
+            for index in missing:
+                ocr_cache.put_page(engine.name, digests[index], pages[index])
+        ocr_cache.put(self._ocr_namespace(engine), document.cache_key, pages)
+        return pages
+
+    def _ocr_steps(self, backend, document: _Document):
+        """
+        Page-level markdown for a document, running OCR only on pages whose
+        content has not been seen before and that have no usable text layer.
+        """
+        known, missing = yield _blocking(self._ocr_plan, document)
+        if known is not None and not missing:
+            return known
+
+        engine = self.ocr_engine
+        url_ref = (yield from self._resolve_url_steps(backend, document)) if engine.needs_url else None
+        ocr_pages = yield _io(
+            engine.extract, engine.aextract,
+            document.path, document.ext, content=document.content, url=url_ref, pages=missing,
+        )
+        return self._store_ocr(document, known, missing, ocr_pages)
+
+    # --- Offline fallback ----------------------------------------------------
+
+    def _local_pages(self, document: _Document) -> List[str]:
+        """
+        Page text obtained without calling Mistral: earlier OCR output, the text
+        layer, then the local fallback engine for scanned pages.
+        """
+        if document.is_url:
+            document.content = url_mirror.fetch(document.path)
+            document.is_url = False
+            document.digest = sha256_bytes(document.content)
+        cached = ocr_cache.get(self._ocr_namespace(self.ocr_engine), document.cache_key)
+        if cached is not None:
+            return cached
+
+        engine = self.fallback_ocr_engine
+        if engine is None:
+            text_layer = self._text_layer(document) or [None]
+            return [text if text is not None else "[scanned page: no local OCR available]" for text in text_layer]
+        known, missing = self._ocr_plan(document, engine)
+        if known is not None and not missing:
+            return known
+        ocr_pages = engine.extract(document.path, document.ext, content=document.content, pages=missing)
+        return self._store_ocr(document, known, missing, ocr_pages, engine)
+
+    def _offline_answer(self, documents, question, items, schema) -> str:
+        """
+        What the tool returns while the Mistral circuit breaker is open: the
+        request plus the documents' locally extracted text, for the calling
+        agent's LLM to answer from.
+        """
+        metrics.increment("pdfqa.fallback.offline_answers")
+        if schema is not None:
+            request = _schema_prompt(schema)
+        elif items is not None:
+            request = "Answer each of these and reply as JSON keyed by name:\n" + json.dumps(items, indent=2)
+        else:
+            request = question
+        sections = [
+            "The document QA service is currently unavailable, so this request was not answered. "
+            "Answer it yourself from the text below, which was extracted from the documents locally.",
+            f"Request:\n{request}",
+        ]
+        for document in documents:
+            try:
+                page_texts = self._local_pages(document)
+            except Exception as exc:
+                sections.append(f"### {document.display_name}\n[text could not be extracted locally: {exc}]")
+                continue
+            selected = self._relevant_pages(page_texts, request) or range(len(page_texts))
+            pages = "\n\n".join(f"[page {index + 1}]\n{page_texts[index]}" for index in selected)
+            sections.append(f"### {document.display_name}\n{pages}")
+        return "\n\n".join(sections)[:OFFLINE_TEXT_LIMIT]
+
+    # --- Uploads -------------------------------------------------------------
+
+    def _upload_key(self, document: _Document) -> str:
+        # Images are uploaded in preprocessed form, so the settings are part of the cache key
+        if document.ext != ".pdf" and self.image_options is not None:
+            return f"{document.digest}:{self.image_options.signature}"
+        return document.digest
+
+    def _upload_payload(self, document: _Document):
+        """
+        (file name, bytes, bytes saved) to upload; images are downscaled /
+        recompressed here, only on a real upload.
+        """
+        file_name, content, bytes_saved = document.display_name, document.content, 0
+        if document.ext != ".pdf" and self.image_options is not None:
+            prepared = shrink_image(content, document.ext, self.image_options)
+            content, bytes_saved = prepared.content, prepared.bytes_saved
+            file_name = os.path.splitext(file_name)[0] + prepared.ext
+        return file_name, content, bytes_saved
+
+    @staticmethod
+    def _reuse_upload(upload_key: str) -> Optional[str]:
+        """Still-valid signed URL for already uploaded content, holding its file for this call."""
+        entry = upload_cache.fresh_entry(upload_key)
+        if entry is None:
+            return None
+        file_registry.use(entry["file_id"])
+        return entry["signed_url"]
+
+    @staticmethod
+    def _remember_upload(upload_key: str, file_id: str, signed_url: str) -> str:
+        expires_at = time.time() + SIGNED_URL_EXPIRY_HOURS * 3600
+        upload_cache.put(upload_key, file_id, signed_url, expires_at)
+        # Track the provider-side file so the sweeper deletes it once it is no longer needed
+        file_registry.register(file_id, upload_key)
+        return signed_url
+
+    def _upload_steps(self, backend, document: _Document):
+        """Return a signed URL for a local file, uploading it only if its content is new."""
+        upload_key = self._upload_key(document)
+        cached = self._reuse_upload(upload_key)
+        if cached:
+            return cached
+
+        # Known content whose URL expired: re-sign the existing file instead of re-uploading
+        entry = upload_cache.get(upload_key)
+        file_id = None
+        if entry:
+            try:
+                with metrics.timed("sign"):
+                    signed = yield _scheduled(
+                        backend.sign, backend.asign, file_id=entry["file_id"], expiry=SIGNED_URL_EXPIRY_HOURS
+                    )
+                file_id = entry["file_id"]
+            except CircuitOpenError:
+                raise
+            except Exception:
+                # The file is gone on the provider side; fall back to a fresh upload
+                upload_cache.invalidate(upload_key)
+
+        if file_id is None:
+            file_name, content, bytes_saved = yield _blocking(self._upload_payload, document)
+            with metrics.timed("upload", bytes=len(content), bytes_saved=bytes_saved):
+                upload_resp = yield _scheduled(backend.upload, backend.aupload, file_name, content)
+            file_id = upload_resp.id
+            # Get a signed HTTPS URL
+            with metrics.timed("sign"):
+                signed = yield _scheduled(backend.sign, backend.asign, file_id=file_id, expiry=SIGNED_URL_EXPIRY_HOURS)
+
+        return self._remember_upload(upload_key, file_id, signed.url)
@@ -2,19 +2,21 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-from crewai import Crew
 from mortgage_crew import MortgageCrew
+from pdfqa_metrics import application_context
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 import io
+import uuid
 from typing import List, Optional
 from pydantic import BaseModel, Field
 
-# Initialize Crew
-crew_instance = MortgageCrew()
-crew = crew_instance.crew()
+# Initialize Crew once per session; Streamlit re-runs this script on every interaction
+if 'crew_instance' not in st.session_state:
+    st.session_state['crew_instance'] = MortgageCrew()
+crew_instance = st.session_state['crew_instance']
 
 # Pydantic Models
 class ApplicantData(BaseModel):
@@ -42,7 +44,22 @@ class DocumentValidationResult(BaseModel):
 # Simulated Crew Output Function
 def run_crew(validation_only=False):
     try:
-        op = crew.kickoff(inputs={'validation_only': validation_only})
+        # Show PDFQATool answers as they stream in, so long reads visibly make progress
+        progress = st.empty()
+        streamed = []
+
+        def show_progress(delta):
+            streamed.append(delta)
+            progress.caption("".join(streamed)[-1500:])
+
+        crew_instance.PDFQATool.stream_callback = show_progress
+        try:
+            # Tag PDFQATool metrics with this session's application
+            with application_context(st.session_state.get('application_id')):
+                op = crew_instance.kickoff(inputs={'validation_only': validation_only})
+        finally:
+            crew_instance.PDFQATool.stream_callback = None
+            progress.empty()
         if validation_only:
             return type('CrewResult', (), {'tasks_output': [
                 type('TaskOutput', (), {'output': op.tasks_output[0].pydantic})
@@ -320,6 +337,8 @@ st.markdown('<div class="upload-container">', unsafe_allow_html=True)
 st.subheader("Upload Documents")
 st.write("Required: ID (e.g., passport), payslip, bank statement, property appraisal")
 
+if 'application_id' not in st.session_state:
+    st.session_state['application_id'] = uuid.uuid4().hex[:12]
 if 'uploaded_files' not in st.session_state:
     st.session_state['uploaded_files'] = []
 if 'validation_result' not in st.session_state:
@@ -1,6 +1,9 @@
 from crewai import Agent, Crew, Process, Task
 from crewai_tools import  DirectoryReadTool
+import functools
+import inspect
 import os
+import threading
 import yaml
 from crewai import LLM
 from pydantic import BaseModel, Field
@@ -57,14 +60,53 @@ os.environ['OPENAI_API_KEY'] = os.getenv("OPENAI_API_KEY")
 
 
 
+def _built_once(method):
+    """Build an agent, task or crew on first use and return that same object afterwards."""
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # prepared(), prepared(False) and prepared(validation_only=False) share one entry
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (method.__name__, *list(bound.arguments.values())[1:])
+        with self._build_lock:
+            if key not in self._built:
+                self._built[key] = method(*bound.args, **bound.kwargs)
+            return self._built[key]
+    return wrapper
+
+
+class PreparedCrew:
+    """
+    A crew built once (agents, tools and memory stores included) that can be
+    kicked off again with new inputs. Runs sharing ``lock`` are serialised,
+    since a Crew and its agents keep per-run state.
+    """
+
+    def __init__(self, crew: Crew, lock: Optional[threading.Lock] = None):
+        self.crew = crew
+        self._lock = lock or threading.Lock()
+
+    def kickoff(self, inputs=None):
+        with self._lock:
+            return self.crew.kickoff(inputs=inputs)
+
+
 class MortgageCrew:
     def __init__(self):
         self.agents_config = agents_config
         self.tasks_config = tasks_config
         self.DirectorySearchTool = DirectoryReadTool(directory='./documents')
         # self.VisionTool = VisionTool()
-        self.PDFQATool = PDFQATool()    
-
+        self.PDFQATool = PDFQATool(output_schemas={"ApplicantData": ApplicantData})
+        # Agents, tasks and crews are built once per instance (see _built_once)
+        self._built = {}
+        self._build_lock = threading.RLock()
+        # Both crews share the validator agent and task, so their runs share one lock
+        self._run_lock = threading.Lock()
+
+    @_built_once
     def document_validator(self) -> Agent:
         return Agent(
             config=self.agents_config['document_validator'],
@@ -75,6 +117,7 @@ class MortgageCrew:
             llm=llm,
         )
 
+    @_built_once
     def loan_processor(self) -> Agent:
         return Agent(
             config=self.agents_config['loan_processor'],
@@ -85,6 +128,7 @@ class MortgageCrew:
             llm=llm,
         )
 
+    @_built_once
     def underwriter(self) -> Agent:
         return Agent(
             config=self.agents_config['underwriter'],
@@ -95,6 +139,7 @@ class MortgageCrew:
             llm=llm,
         )
 
+    @_built_once
     def validate_documents_task(self) -> Task:
         return Task(
             config=self.tasks_config['validate_documents_task'],
@@ -106,6 +151,7 @@ class MortgageCrew:
          
         )
 
+    @_built_once
     def process_documents_task(self) -> Task:
         return Task(
             config=self.tasks_config['process_documents_task'],
@@ -117,6 +163,7 @@ class MortgageCrew:
             # fallback_tools=[self.VisionTool],
         )
 
+    @_built_once
     def underwriter_task(self) -> Task:
         return Task(
             config=self.tasks_config['assess_creditworthiness_task'],
@@ -128,6 +175,7 @@ class MortgageCrew:
           
         )
 
+    @_built_once
     def crew(self):
         return Crew(
             agents=[self.document_validator(), self.loan_processor(), self.underwriter()],
@@ -141,15 +189,21 @@ class MortgageCrew:
             verbose=True,
         )
 
+    @_built_once
+    def validation_crew(self):
+        return Crew(
+            agents=[self.document_validator()],
+            tasks=[self.validate_documents_task()],
+            process=Process.sequential,
+            memory=True,
+            verbose=True,
+        )
+
+    @_built_once
+    def prepared(self, validation_only: bool = False) -> PreparedCrew:
+        """The validation-only or full crew, ready to be kicked off repeatedly."""
+        return PreparedCrew(self.validation_crew() if validation_only else self.crew(), lock=self._run_lock)
+
     def kickoff(self, inputs=None):
         validation_only = inputs.get('validation_only', False) if inputs else False
-        if validation_only:
-            crew = Crew(
-                agents=[self.document_validator()],
-                tasks=[self.validate_documents_task()],
-                process=Process.sequential,
-                memory=True,
-                verbose=True,
-            )
-            return crew.kickoff(inputs=inputs)
-        return self.crew().kickoff(inputs=inputs)
+        return self.prepared(validation_only).kickoff(inputs=inputs)
@@ -0,0 +1,120 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from pdfqa_client import get_async_mistral_client, get_mistral_client
+
+
+class QABackend(ABC):
+    """
+    The provider operations PDFQATool relies on: upload, sign, delete,
+    complete, stream and OCR, each with an async twin.
+
+    Responses follow the Mistral SDK's shapes: uploads have ``.id``, signed
+    URLs ``.url``, completions ``.choices``/``.usage``, streams yield events
+    with ``.data`` and OCR results have ``.pages``. Requests are the SDK's
+    keyword arguments (``model``, ``messages``, ``document``...).
+    """
+
+    name: str = "base"
+
+    @abstractmethod
+    def upload(self, file_name: str, content: bytes): ...
+
+    @abstractmethod
+    def sign(self, file_id: str, expiry: int): ...
+
+    @abstractmethod
+    def delete(self, file_id: str): ...
+
+    @abstractmethod
+    def complete(self, **request): ...
+
+    @abstractmethod
+    def stream(self, **request): ...
+
+    @abstractmethod
+    def ocr(self, **request): ...
+
+    @abstractmethod
+    async def aupload(self, file_name: str, content: bytes): ...
+
+    @abstractmethod
+    async def asign(self, file_id: str, expiry: int): ...
+
+    @abstractmethod
+    async def adelete(self, file_id: str): ...
+
+    @abstractmethod
+    async def acomplete(self, **request): ...
+
+    @abstractmethod
+    async def astream(self, **request): ...
+
+    @abstractmethod
+    async def aocr(self, **request): ...
+
+
+class MistralBackend(QABackend):
+    """The Mistral SDK through the shared pooled clients (MISTRAL_SERVER_URL points it elsewhere)."""
+
+    name = "mistral"
+
+    def upload(self, file_name, content):
+        return get_mistral_client().files.upload(file={"file_name": file_name, "content": content}, purpose="ocr")
+
+    def sign(self, file_id, expiry):
+        return get_mistral_client().files.get_signed_url(file_id=file_id, expiry=expiry)
+
+    def delete(self, file_id):
+        return get_mistral_client().files.delete(file_id=file_id)
+
+    def complete(self, **request):
+        return get_mistral_client().chat.complete(**request)
+
+    def stream(self, **request):
+        return get_mistral_client().chat.stream(**request)
+
+    def ocr(self, **request):
+        return get_mistral_client().ocr.process(**request)
+
+    async def aupload(self, file_name, content):
+        return await get_async_mistral_client().files.upload_async(
+            file={"file_name": file_name, "content": content}, purpose="ocr"
+        )
+
+    async def asign(self, file_id, expiry):
+        return await get_async_mistral_client().files.get_signed_url_async(file_id=file_id, expiry=expiry)
+
+    async def adelete(self, file_id):
+        return await get_async_mistral_client().files.delete_async(file_id=file_id)
+
+    async def acomplete(self, **request):
+        return await get_async_mistral_client().chat.complete_async(**request)
+
+    async def astream(self, **request):
+        return await get_async_mistral_client().chat.stream_async(**request)
+
+    async def aocr(self, **request):
+        return await get_async_mistral_client().ocr.process_async(**request)
+
+
+_backend: Optional[QABackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> QABackend:
+    """Process-wide backend used by PDFQATool, the Mistral OCR engine and the file sweeper."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = MistralBackend()
+    return _backend
+
+
+def set_backend(backend: QABackend) -> None:
+    """Replace the shared backend, e.g. with another provider or a test double."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Root directory for everything PDFQATool persists between runs
+CACHE_DIR = os.getenv("PDFQA_CACHE_DIR", "./.pdfqa_cache")
+
+
+def sha256_bytes(data: bytes) -> str:
+    """Hex SHA-256 of raw file bytes, used as the content address of a document."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _atomic_write_json(path: str, payload) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class UploadCache:
+    """
+    Persistent map from a document's SHA-256 to its Mistral file id and signed URL.
+
+    Entries survive process restarts, so a document is uploaded once and only
+    re-signed when its signed URL is about to expire.
+    """
+
+    def __init__(self, path: Optional[str] = None, expiry_margin: float = 300.0):
+        self.path = path or os.path.join(CACHE_DIR, "uploads.json")
+        # Signed URLs closer than this many seconds to expiry are treated as stale
+        self.expiry_margin = expiry_margin
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = _read_json(self.path, {})
+
+    def get(self, digest: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            return dict(entry) if entry else None
+
+    def fresh_entry(self, digest: str) -> Optional[dict]:
+        """The entry for ``digest`` if its signed URL is still usable."""
+        entry = self.get(digest)
+        if entry and entry.get("signed_url") and entry.get("expires_at", 0) - self.expiry_margin > time.time():
+            return entry
+        return None
+
+    def entries(self) -> Dict[str, dict]:
+        with self._lock:
+            return {digest: dict(entry) for digest, entry in self._entries.items()}
+
+    def put(self, digest: str, file_id: str, signed_url: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[digest] = {
+                "file_id": file_id,
+                "signed_url": signed_url,
+                "expires_at": expires_at,
+            }
+            _atomic_write_json(self.path, self._entries)
+
+    def invalidate(self, digest: str) -> None:
+        with self._lock:
+            if self._entries.pop(digest, None) is not None:
+                _atomic_write_json(self.path, self._entries)
+
+    def invalidate_file(self, file_id: str) -> None:
+        """Drop every entry pointing at ``file_id``, e.g. once the file is deleted on the provider side."""
+        with self._lock:
+            stale = [digest for digest, entry in self._entries.items() if entry.get("file_id") == file_id]
+            for digest in stale:
+                del self._entries[digest]
+            if stale:
+                _atomic_write_json(self.path, self._entries)
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivially different phrasings share a key."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?.!:; ")
+
+
+class AnswerCache:
+    """
+    Memoizes model answers keyed by (file content hashes, normalized question, model, temperature).
+
+    Recent answers live in an in-memory LRU; every answer is also written to
+    disk so it survives restarts. Entries older than ``ttl`` seconds are ignored.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 512, ttl: float = 7 * 24 * 3600):
+        self.directory = directory or os.path.join(CACHE_DIR, "answers")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+
+    @staticmethod
+    def make_key(file_keys: List[str], question: str, model: str, temperature: float, mode: str = "document") -> str:
+        payload = json.dumps([file_keys, normalize_question(question), model, temperature, mode])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, entry: dict) -> bool:
+        return time.time() - entry.get("created_at", 0) > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry):
+                    self._memory.move_to_end(key)
+                    return entry["answer"]
+                del self._memory[key]
+
+        entry = _read_json(self._disk_path(key), None)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            return None
+        self._remember(key, entry)
+        return entry["answer"]
+
+    def put(self, key: str, answer: str) -> None:
+        entry = {"answer": answer, "created_at": time.time()}
+        self._remember(key, entry)
+        _atomic_write_json(self._disk_path(key), entry)
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+class OCRCache:
+    """
+    Page-level OCR markdown per (engine, document content), stored one JSON file per document.
+
+    Pages are also cached on their own, keyed by page digest, so a re-issued
+    document only has its changed pages OCR'd again.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(CACHE_DIR, "ocr")
+
+    def _disk_path(self, engine_name: str, document_key: str) -> str:
+        key = hashlib.sha256(f"{engine_name}|{document_key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, engine_name: str, document_key: str) -> Optional[List[str]]:
+        entry = _read_json(self._disk_path(engine_name, document_key), None)
+        return entry["pages"] if entry else None
+
+    def put(self, engine_name: str, document_key: str, pages: List[str]) -> None:
+        _atomic_write_json(self._disk_path(engine_name, document_key), {"pages": pages, "created_at": time.time()})
+
+    def get_page(self, engine_name: str, page_digest: str) -> Optional[str]:
+        pages = self.get(engine_name, f"page:{page_digest}")
+        return pages[0] if pages else None
+
+    def put_page(self, engine_name: str, page_digest: str, text: str) -> None:
+        self.put(engine_name, f"page:{page_digest}", [text])
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    def __init__(self, task: "asyncio.Future"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller runs the work; callers arriving while it is in flight wait
+    for and share its result (or exception). Nothing is remembered once the
+    call completes; that is the answer cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[Tuple[Any, str], _AsyncFlight] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight ``key``; returns (result, shared) where shared means it was coalesced."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    async def ado(self, key: str, coro_fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Async ``do`` for callers on the same event loop. The shared work is only
+        cancelled once every caller waiting on it has been cancelled.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        flight = self._async_flights.get(flight_key)
+        shared = flight is not None
+        if not shared:
+            flight = self._async_flights[flight_key] = _AsyncFlight(asyncio.ensure_future(coro_fn()))
+            flight.task.add_done_callback(lambda _: self._async_flights.pop(flight_key, None))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+upload_cache = UploadCache()
+ocr_cache = OCRCache()
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("PDFQA_ANSWER_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("PDFQA_ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+)
+single_flight = SingleFlight()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+from mistralai import Mistral
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connection pool settings for the shared client; overridable via configure_mistral_client()
+_settings = {
+    "pool_size": int(os.getenv("MISTRAL_POOL_SIZE", "20")),
+    "timeout": float(os.getenv("MISTRAL_TIMEOUT", "120")),
+    "keepalive_expiry": float(os.getenv("MISTRAL_KEEPALIVE_EXPIRY", "60")),
+    # Alternative API endpoint, e.g. the local stand-in server in pdfqa_standin
+    "server_url": os.getenv("MISTRAL_SERVER_URL") or None,
+}
+
+_client: Optional[Mistral] = None
+_http_client: Optional[httpx.Client] = None
+# httpx.AsyncClient is bound to the event loop it first runs on, so async clients are kept per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Mistral]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _api_key() -> str:
+    api_key = os.getenv("MISTRAL_API_KEY")
+    if not api_key:
+        raise ValueError("MISTRAL_API_KEY must be set in the environment")
+    return api_key
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_settings["pool_size"],
+        max_keepalive_connections=_settings["pool_size"],
+        keepalive_expiry=_settings["keepalive_expiry"],
+    )
+
+
+def configure_mistral_client(pool_size: Optional[int] = None, timeout: Optional[float] = None,
+                             keepalive_expiry: Optional[float] = None, server_url: Optional[str] = None) -> None:
+    """
+    Change pool settings. The shared client is rebuilt lazily on next use; the
+    old pool is left to in-flight calls rather than closed underneath them.
+    """
+    global _client, _http_client
+    with _lock:
+        if pool_size is not None:
+            _settings["pool_size"] = pool_size
+        if timeout is not None:
+            _settings["timeout"] = timeout
+        if keepalive_expiry is not None:
+            _settings["keepalive_expiry"] = keepalive_expiry
+        if server_url is not None:
+            _settings["server_url"] = server_url or None
+        _client = None
+        _http_client = None
+        _async_clients.clear()
+
+
+def get_mistral_client() -> Mistral:
+    """
+    Return the process-wide Mistral client, creating it on first use.
+
+    The client sits on a single keep-alive httpx pool, so concurrent tool calls
+    share open TLS connections instead of handshaking on every question.
+    """
+    global _client, _http_client
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=httpx.Timeout(_settings["timeout"]))
+            _client = Mistral(
+                api_key=_api_key(),
+                client=_http_client,
+                timeout_ms=int(_settings["timeout"] * 1000),
+                server_url=_settings["server_url"],
+            )
+        return _client
+
+
+def get_async_mistral_client() -> Mistral:
+    """
+    Return the Mistral client for async calls on the running event loop.
+
+    Each loop gets one client with its own keep-alive pool, created on first
+    use and shared by every coroutine on that loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = Mistral(
+                api_key=_api_key(),
+                async_client=httpx.AsyncClient(limits=_limits(), timeout=httpx.Timeout(_settings["timeout"])),
+                timeout_ms=int(_settings["timeout"] * 1000),
+                server_url=_settings["server_url"],
+            )
+            _async_clients[loop] = client
+        return client
+
+
+def close_mistral_client() -> None:
+    """Close the shared connection pool (e.g. at shutdown or after a fork)."""
+    global _client, _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _client = None
+        _http_client = None
@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set
+
+from pdfqa_backend import get_backend
+from pdfqa_cache import CACHE_DIR, UploadCache, _atomic_write_json, _read_json, upload_cache
+from pdfqa_metrics import metrics
+from pdfqa_scheduler import _status_code, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Files used by the PDFQATool call in progress; released together when it ends
+_held_files: ContextVar[Optional[Set[str]]] = ContextVar("pdfqa_held_files", default=None)
+
+
+class FileRegistry:
+    """
+    Every file PDFQATool has uploaded to Mistral, with when it was last used.
+
+    Calls in progress hold a reference on the files they use, so a file is
+    only collectable once no call holds it and it has gone unused for
+    ``retention`` seconds, or no upload-cache entry points at it any more.
+    Reference counts are per process; the retention window covers other
+    processes sharing the cache directory.
+    """
+
+    def __init__(self, path: Optional[str] = None, cache: Optional[UploadCache] = None,
+                 retention: float = 24 * 3600, orphan_grace: float = 300.0):
+        self.path = path or os.path.join(CACHE_DIR, "files.json")
+        self.cache = cache or upload_cache
+        self.retention = retention
+        # Orphans (no cache entry) are kept this long, in case the entry is still being written
+        self.orphan_grace = orphan_grace
+        self._lock = threading.Lock()
+        self._refs: Dict[str, int] = {}
+        self._files: Dict[str, dict] = _read_json(self.path, {})
+        self._adopt_cached_files()
+
+    def _adopt_cached_files(self) -> None:
+        """Track files uploaded before the registry existed, dating them from their signed URL."""
+        changed = False
+        for upload_key, entry in self.cache.entries().items():
+            file_id = entry.get("file_id")
+            if file_id and file_id not in self._files:
+                last_used = entry.get("expires_at", time.time()) - 24 * 3600
+                self._files[file_id] = {"upload_key": upload_key, "created": last_used, "last_used": last_used}
+                changed = True
+        if changed:
+            _atomic_write_json(self.path, self._files)
+
+    def register(self, file_id: str, upload_key: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._files.setdefault(file_id, {"upload_key": upload_key, "created": now, "last_used": now})
+            _atomic_write_json(self.path, self._files)
+        self.use(file_id)
+
+    def use(self, file_id: str) -> None:
+        """Mark ``file_id`` as used now, holding a reference until the current call ends."""
+        with self._lock:
+            entry = self._files.get(file_id)
+            if entry is not None:
+                entry["last_used"] = time.time()
+            held = _held_files.get()
+            if held is not None and file_id not in held:
+                held.add(file_id)
+                self._refs[file_id] = self._refs.get(file_id, 0) + 1
+
+    @contextmanager
+    def track(self):
+        """Hold every file used inside the block (including its worker threads) until it exits."""
+        held: Set[str] = set()
+        token = _held_files.set(held)
+        try:
+            yield held
+        finally:
+            _held_files.reset(token)
+            with self._lock:
+                for file_id in held:
+                    remaining = self._refs.get(file_id, 0) - 1
+                    if remaining > 0:
+                        self._refs[file_id] = remaining
+                    else:
+                        self._refs.pop(file_id, None)
+                if held:
+                    _atomic_write_json(self.path, self._files)
+
+    def claim_collectable(self, limit: int) -> List[str]:
+        """
+        Up to ``limit`` unreferenced files that are expired or orphaned, removed from
+        the registry and the upload cache so no new call picks them up.
+        """
+        cached_ids = {entry.get("file_id") for entry in self.cache.entries().values()}
+        now = time.time()
+        with self._lock:
+            claimed = []
+            for file_id, entry in sorted(self._files.items(), key=lambda item: item[1].get("last_used", 0)):
+                if len(claimed) >= limit:
+                    break
+                if self._refs.get(file_id):
+                    continue
+                idle = now - entry.get("last_used", 0)
+                if idle > self.retention or (file_id not in cached_ids and idle > self.orphan_grace):
+                    claimed.append(file_id)
+            for file_id in claimed:
+                del self._files[file_id]
+            if claimed:
+                _atomic_write_json(self.path, self._files)
+        for file_id in claimed:
+            self.cache.invalidate_file(file_id)
+        return claimed
+
+    def restore(self, file_id: str) -> None:
+        """Put back a claimed file whose deletion failed, so the next sweep retries it."""
+        now = time.time()
+        with self._lock:
+            self._files.setdefault(file_id, {"upload_key": None, "created": now, "last_used": 0})
+            _atomic_write_json(self.path, self._files)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._files)
+
+
+class FileSweeper:
+    """
+    Background thread deleting collectable files from Mistral in batches.
+
+    Each sweep deletes up to ``batch_size`` files concurrently and keeps going
+    while full batches come back, so a backlog drains without an unbounded burst.
+    """
+
+    def __init__(self, registry: FileRegistry, interval: float = 600.0, batch_size: int = 50, workers: int = 4):
+        self.registry = registry
+        self.interval = interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _delete(self, file_id: str) -> bool:
+        try:
+            get_scheduler().call(get_backend().delete, file_id)
+        except Exception as exc:
+            if _status_code(exc) == 404:
+                return True
+            logger.warning("Could not delete Mistral file %s (%s); will retry", file_id, exc)
+            self.registry.restore(file_id)
+            return False
+        return True
+
+    def sweep(self) -> int:
+        """Delete collectable files now; returns how many were deleted."""
+        deleted = 0
+        while True:
+            batch = self.registry.claim_collectable(self.batch_size)
+            if not batch:
+                break
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(batch)))) as executor:
+                outcomes = list(executor.map(self._delete, batch))
+            deleted += sum(outcomes)
+            metrics.increment("pdfqa.files.deleted", sum(outcomes))
+            metrics.increment("pdfqa.files.delete_failed", len(outcomes) - sum(outcomes))
+            if len(batch) < self.batch_size or not all(outcomes):
+                break
+        return deleted
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Mistral file sweep failed")
+
+    def start(self) -> None:
+        """Start the sweeper thread once; a non-positive interval disables it."""
+        with self._lock:
+            if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="pdfqa-file-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+file_registry = FileRegistry(retention=float(os.getenv("PDFQA_FILE_RETENTION_HOURS", "24")) * 3600)
+file_sweeper = FileSweeper(
+    file_registry,
+    interval=float(os.getenv("PDFQA_FILE_SWEEP_INTERVAL", "600")),
+    batch_size=int(os.getenv("PDFQA_FILE_SWEEP_BATCH", "50")),
+)
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Application the current PDFQATool calls belong to; set with ``application_context``
+_application_id: ContextVar[Optional[str]] = ContextVar(
+    "pdfqa_application_id", default=os.getenv("PDFQA_APPLICATION_ID")
+)
+_current_call: ContextVar[Optional["CallRecord"]] = ContextVar("pdfqa_current_call", default=None)
+
+
+@contextmanager
+def application_context(application_id: Optional[str]):
+    """Tag every PDFQATool call made inside the block (including worker threads it spawns) with ``application_id``."""
+    token = _application_id.set(application_id)
+    try:
+        yield
+    finally:
+        _application_id.reset(token)
+
+
+def current_application_id() -> Optional[str]:
+    return _application_id.get()
+
+
+class CallRecord:
+    """Cost and timing of one PDFQATool call, summed over every upload, sign and completion it made."""
+
+    def __init__(self, application_id: Optional[str], **details):
+        self.call_id = uuid.uuid4().hex[:12]
+        self.application_id = application_id
+        self.details = details
+        self.started = time.time()
+        self.seconds: Optional[float] = None
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, seconds: Optional[float], amounts: Dict[str, float]) -> None:
+        with self._lock:
+            self.totals[f"{kind}_count"] += 1
+            if seconds is not None:
+                self.totals[f"{kind}_seconds"] += seconds
+            for name, value in amounts.items():
+                self.totals[f"{kind}_{name}"] += value
+
+    def annotate(self, key: str, value: Any) -> None:
+        with self._lock:
+            self.details.setdefault(key, []).append(value)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {name: round(value, 4) for name, value in self.totals.items()}
+            details = {key: list(value) if isinstance(value, list) else value for key, value in self.details.items()}
+        return {
+            "call_id": self.call_id,
+            "application_id": self.application_id,
+            "started": self.started,
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            **details,
+            "totals": totals,
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process metrics for PDFQATool, read with ``snapshot()``.
+
+    Counters are plain totals; ``observe`` keeps count/sum/max per name for
+    latencies. Completed calls are kept in a bounded list (``recent_calls``) and,
+    when a JSONL path is configured, appended to it one record per line.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, max_recent_calls: int = 500):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._recent_calls: deque = deque(maxlen=max_recent_calls)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def record(self, kind: str, seconds: Optional[float] = None, **amounts: float) -> None:
+        """
+        One API operation (``upload``, ``sign``, ``completion``, ``ocr``...): its
+        latency and amounts such as bytes or tokens, added to the global metrics
+        and to the call in progress.
+        """
+        self.increment(f"pdfqa.{kind}.count")
+        if seconds is not None:
+            self.observe(f"pdfqa.{kind}.seconds", seconds)
+        for name, value in amounts.items():
+            self.increment(f"pdfqa.{kind}.{name}", value)
+        call = _current_call.get()
+        if call is not None:
+            call.add(kind, seconds, amounts)
+
+    def annotate(self, key: str, value: Any) -> None:
+        """Append ``value`` to the ``key`` list of the call in progress, e.g. which model answered it."""
+        call = _current_call.get()
+        if call is not None:
+            call.annotate(key, value)
+
+    @contextmanager
+    def timed(self, kind: str, **amounts: float):
+        """Time the block as one ``kind`` operation; the yielded dict takes amounts only known afterwards (e.g. tokens)."""
+        started = time.perf_counter()
+        yield amounts
+        self.record(kind, time.perf_counter() - started, **amounts)
+
+    @contextmanager
+    def track_call(self, **details):
+        """Collect everything recorded inside the block into one ``CallRecord``, tagged with the application id."""
+        call = CallRecord(current_application_id(), **details)
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        try:
+            yield call
+        finally:
+            _current_call.reset(token)
+            call.seconds = time.perf_counter() - started
+            self.observe("pdfqa.call.seconds", call.seconds)
+            self._finish(call)
+
+    def _finish(self, call: CallRecord) -> None:
+        record = call.as_dict()
+        with self._lock:
+            self._recent_calls.append(record)
+            if not self.jsonl_path:
+                return
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as sink:
+                    sink.write(json.dumps(record, default=str) + "\n")
+            except OSError as exc:
+                logger.warning("Could not write PDFQATool metrics to %s (%s)", self.jsonl_path, exc)
+
+    def recent_calls(self, application_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            calls = list(self._recent_calls)
+        if application_id is not None:
+            calls = [call for call in calls if call["application_id"] == application_id]
+        return calls
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._counters)
+            for name, summary in self._summaries.items():
+                snapshot[name] = dict(summary)
+            return snapshot
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+            self._recent_calls.clear()
+
+
+metrics = MetricsRegistry(jsonl_path=os.getenv("PDFQA_METRICS_JSONL") or None)
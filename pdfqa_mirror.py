@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from pdfqa_cache import CACHE_DIR, _atomic_write_json, _read_json
+from pdfqa_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UrlMirror:
+    """
+    Local copies of remote documents, downloaded once and revalidated with ETag / Last-Modified.
+
+    A copy checked within ``max_age`` seconds is served without contacting the
+    origin. Older copies are revalidated with a conditional GET; if the origin
+    is slow or down, the last good copy is served instead of failing the call.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_age: float = 300.0, timeout: float = 30.0):
+        self.directory = directory or os.path.join(CACHE_DIR, "mirror")
+        self.max_age = max_age
+        self.timeout = timeout
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+    def _paths(self, url: str):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.bin"), os.path.join(self.directory, f"{name}.json")
+
+    def _http(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(follow_redirects=True, timeout=self.timeout)
+            return self._client
+
+    def _url_lock(self, url: str) -> threading.Lock:
+        # One download per URL at a time; concurrent callers wait and then reuse the copy
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url: str) -> bytes:
+        """Bytes of ``url``, from the mirror when it is fresh or unchanged at the origin."""
+        with self._url_lock(url):
+            content_path, meta_path = self._paths(url)
+            meta = _read_json(meta_path, None)
+            content = None
+            if meta is not None:
+                try:
+                    with open(content_path, "rb") as f:
+                        content = f.read()
+                except OSError:
+                    meta = None
+
+            if content is not None and time.time() - meta.get("checked_at", 0) < self.max_age:
+                metrics.increment("pdfqa.mirror.fresh")
+                return content
+
+            headers = {}
+            if content is not None:
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+
+            try:
+                with metrics.timed("mirror_fetch") as amounts:
+                    response = self._http().get(url, headers=headers)
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                    amounts["bytes"] = len(response.content)
+            except httpx.HTTPError as exc:
+                if content is None:
+                    raise
+                logger.warning("Could not revalidate %s (%s); using the mirrored copy", url, exc)
+                metrics.increment("pdfqa.mirror.stale")
+                return content
+
+            if response.status_code == 304:
+                metrics.increment("pdfqa.mirror.not_modified")
+            else:
+                content = response.content
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f"{content_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, content_path)
+                meta = {
+                    "url": url,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+            meta["checked_at"] = time.time()
+            _atomic_write_json(meta_path, meta)
+            return content
+
+
+url_mirror = UrlMirror(
+    max_age=float(os.getenv("PDFQA_MIRROR_MAX_AGE", "300")),
+    timeout=float(os.getenv("PDFQA_MIRROR_TIMEOUT", "30")),
+)
@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import io
+import multiprocessing
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+try:
+    import pytesseract
+except ImportError:  # pytesseract is optional; without it there is no local OCR fallback
+    pytesseract = None
+
+try:
+    import pypdfium2
+except ImportError:  # pypdfium2 is optional; without it local OCR handles images only
+    pypdfium2 = None
+
+from pdfqa_backend import get_backend
+from pdfqa_metrics import metrics
+from pdfqa_scheduler import get_scheduler
+
+
+class OCREngine(ABC):
+    """
+    Turns one document into a list of page-level markdown strings.
+
+    Engines that read a hosted copy of the document set ``needs_url`` and get a
+    signed URL; local engines read ``content`` directly.
+    """
+
+    # Part of the OCR cache key, so switching engines never serves another engine's text
+    name: str = "base"
+    needs_url: bool = False
+
+    @abstractmethod
+    def extract(self, path: str, ext: str, content: Optional[bytes] = None, url: Optional[str] = None,
+                pages: Optional[List[int]] = None) -> List[str]:
+        """Markdown for each page, or only for the 0-based ``pages`` of a PDF when given."""
+
+    async def aextract(self, path: str, ext: str, content: Optional[bytes] = None, url: Optional[str] = None,
+                       pages: Optional[List[int]] = None) -> List[str]:
+        """Async ``extract``; engines without native async support run in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.extract, path, ext, content=content, url=url, pages=pages)
+        )
+
+
+class MistralOCREngine(OCREngine):
+    """Mistral's dedicated OCR endpoint (``ocr.process``), called through the shared backend."""
+
+    needs_url = True
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or os.getenv("PDFQA_OCR_MODEL", "mistral-ocr-latest")
+        self.name = f"mistral:{self.model}"
+
+    def _request(self, ext, url, pages) -> dict:
+        if ext == ".pdf":
+            request = {"document": {"type": "document_url", "document_url": url}}
+            if pages is not None:
+                request["pages"] = pages
+            return request
+        return {"document": {"type": "image_url", "image_url": url}}
+
+    @staticmethod
+    def _markdown(ocr_resp) -> List[str]:
+        return [page.markdown for page in sorted(ocr_resp.pages, key=lambda page: page.index)]
+
+    def extract(self, path, ext, content=None, url=None, pages=None) -> List[str]:
+        with metrics.timed("ocr") as amounts:
+            ocr_resp = get_scheduler().call(
+                get_backend().ocr, model=self.model, **self._request(ext, url, pages)
+            )
+            amounts["pages"] = len(ocr_resp.pages)
+        return self._markdown(ocr_resp)
+
+    async def aextract(self, path, ext, content=None, url=None, pages=None) -> List[str]:
+        with metrics.timed("ocr") as amounts:
+            ocr_resp = await get_scheduler().acall(
+                get_backend().aocr, model=self.model, **self._request(ext, url, pages)
+            )
+            amounts["pages"] = len(ocr_resp.pages)
+        return self._markdown(ocr_resp)
+
+
+def _tesseract_image(content: bytes, lang: str) -> str:
+    # Runs in a worker process
+    from PIL import Image
+    return pytesseract.image_to_string(Image.open(io.BytesIO(content)), lang=lang)
+
+
+def _tesseract_pdf_page(content: bytes, index: int, lang: str, dpi: int) -> str:
+    # Runs in a worker process
+    page = pypdfium2.PdfDocument(content)[index]
+    image = page.render(scale=dpi / 72.0).to_pil()
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("PDFQA_LOCAL_OCR_WORKERS", "0")) or None
+            # Forking a process that already runs many threads can deadlock the child on their locks
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+class TesseractOCREngine(OCREngine):
+    """
+    Offline OCR with Tesseract, one page per task on a shared process pool.
+
+    Needs pytesseract and the ``tesseract`` binary; PDFs are rendered with
+    pypdfium2. Output is plain text rather than markdown.
+    """
+
+    needs_url = False
+
+    def __init__(self, lang: Optional[str] = None, dpi: Optional[int] = None):
+        self.lang = lang or os.getenv("PDFQA_LOCAL_OCR_LANG", "eng")
+        self.dpi = dpi or int(os.getenv("PDFQA_LOCAL_OCR_DPI", "200"))
+        self.name = f"tesseract:{self.lang}"
+
+    @staticmethod
+    def available() -> bool:
+        """Whether pytesseract imports and the ``tesseract`` binary it drives can be found."""
+        if pytesseract is None:
+            return False
+        command = getattr(pytesseract.pytesseract, "tesseract_cmd", "tesseract")
+        return shutil.which(command) is not None
+
+    def _submit(self, ext, content, pages):
+        if pytesseract is None:
+            raise RuntimeError("Local OCR needs pytesseract and the tesseract binary")
+        pool = _process_pool()
+        if ext != ".pdf":
+            return [pool.submit(_tesseract_image, content, self.lang)]
+        if pypdfium2 is None:
+            raise RuntimeError("Local OCR of PDFs needs pypdfium2")
+        indices = pages if pages is not None else range(len(pypdfium2.PdfDocument(content)))
+        return [pool.submit(_tesseract_pdf_page, content, index, self.lang, self.dpi) for index in indices]
+
+    def extract(self, path, ext, content=None, url=None, pages=None) -> List[str]:
+        return [future.result() for future in self._submit(ext, content, pages)]
+
+    async def aextract(self, path, ext, content=None, url=None, pages=None) -> List[str]:
+        futures = self._submit(ext, content, pages)
+        return list(await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)))
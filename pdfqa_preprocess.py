@@ -0,0 +1,280 @@
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Literal, NamedTuple, Optional
+
+from pydantic import BaseModel, Field
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are uploaded untouched
+    Image = ImageOps = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+except ImportError:  # pypdf is optional; without it every PDF goes through OCR
+    PdfReader = PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+
+class ImageOptions(BaseModel):
+    """How scans and photos are shrunk before upload."""
+    max_long_edge: int = Field(
+        default=int(os.getenv("PDFQA_IMAGE_MAX_EDGE", "2000")),
+        description="Longest side in pixels; larger images are downscaled"
+    )
+    max_dpi: Optional[int] = Field(
+        default=int(os.getenv("PDFQA_IMAGE_MAX_DPI")) if os.getenv("PDFQA_IMAGE_MAX_DPI") else None,
+        description="If the image declares a higher DPI, it is downscaled to this resolution"
+    )
+    output_format: Literal["JPEG", "WEBP"] = Field(
+        default=os.getenv("PDFQA_IMAGE_FORMAT", "JPEG"),
+        description="Format that photographic PNGs are re-encoded to"
+    )
+    quality: int = Field(default=int(os.getenv("PDFQA_IMAGE_QUALITY", "85")), ge=1, le=100)
+
+    @property
+    def signature(self) -> str:
+        """Identifies the settings, so uploads made with different settings are cached separately."""
+        return f"{self.max_long_edge}-{self.max_dpi}-{self.output_format}-{self.quality}"
+
+
+class PreparedImage(NamedTuple):
+    content: bytes
+    ext: str
+    bytes_saved: int
+
+
+# Images with more distinct colours than this are treated as photos rather than line art
+_PHOTO_COLOR_THRESHOLD = 256
+
+
+def shrink_image(content: bytes, ext: str, options: ImageOptions) -> PreparedImage:
+    """
+    Downscale an image to ``options`` and re-encode photographic PNGs as JPEG/WebP.
+
+    The smaller of the original and the processed bytes is returned, so the
+    result is never larger than the input.
+    """
+    unchanged = PreparedImage(content, ext, 0)
+    if Image is None:
+        return unchanged
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+        # Phone photos are stored sideways with an EXIF Orientation tag that re-encoding would drop
+        image = ImageOps.exif_transpose(image)
+    except (OSError, ValueError):
+        logger.warning("Could not decode image for preprocessing; uploading it unchanged")
+        return unchanged
+
+    # 1. Cap resolution by declared DPI and by the longest edge
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if options.max_dpi and dpi and dpi[0] and dpi[0] > options.max_dpi:
+        scale = min(scale, options.max_dpi / float(dpi[0]))
+    long_edge = max(image.size)
+    if options.max_long_edge and long_edge * scale > options.max_long_edge:
+        scale = options.max_long_edge / float(long_edge)
+    if scale < 1.0:
+        new_size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image = image.resize(new_size, Image.LANCZOS)
+
+    # 2. Choose the output encoding: lossy for photos, PNG for line art and screenshots
+    is_photo = image.getcolors(maxcolors=_PHOTO_COLOR_THRESHOLD) is None
+    if ext == ".png" and not is_photo:
+        output_format, new_ext, save_kwargs = "PNG", ".png", {"optimize": True}
+    else:
+        output_format = options.output_format
+        new_ext = ".webp" if output_format == "WEBP" else ".jpg"
+        save_kwargs = {"quality": options.quality}
+        if output_format == "JPEG":
+            save_kwargs.update(optimize=True, progressive=True)
+        if image.mode not in ("RGB", "L"):
+            # Flatten transparency onto white, as a scanned page would be
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=output_format, **save_kwargs)
+    processed = buffer.getvalue()
+
+    if len(processed) >= len(content):
+        return unchanged
+    bytes_saved = len(content) - len(processed)
+    logger.info("Image preprocessing saved %d bytes (%d -> %d)", bytes_saved, len(content), len(processed))
+    return PreparedImage(processed, new_ext, bytes_saved)
+
+
+# A page needs at least this much real text before its text layer is trusted over OCR
+MIN_TEXT_LAYER_CHARS = 40
+
+
+def _is_usable_text(text: Optional[str]) -> bool:
+    stripped = (text or "").strip()
+    if len(stripped) < MIN_TEXT_LAYER_CHARS:
+        return False
+    # Broken font encodings come out as control characters or symbol soup
+    printable = sum(1 for ch in stripped if ch.isprintable() or ch.isspace())
+    alphanumeric = sum(1 for ch in stripped if ch.isalnum())
+    return printable / len(stripped) > 0.95 and alphanumeric / len(stripped) > 0.5
+
+
+def extract_text_layer(content: bytes) -> Optional[List[Optional[str]]]:
+    """
+    Per-page text from a PDF's embedded text layer.
+
+    Returns one entry per page: the text, or None where the page has no usable
+    text (a scanned image) and needs OCR. Returns None when the PDF cannot be
+    read locally at all.
+    """
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(content))
+        pages = []
+        for page in reader.pages:
+            text = page.extract_text()
+            pages.append(text.strip() if _is_usable_text(text) else None)
+        return pages
+    except Exception as exc:
+        # pypdf raises a variety of errors on malformed files; OCR handles those instead
+        logger.warning("Could not read PDF text layer (%s); falling back to OCR", exc)
+        return None
+
+
+def can_split_pdf() -> bool:
+    """Whether ``subset_pdf`` is available (it needs pypdf)."""
+    return PdfWriter is not None
+
+
+def subset_pdf(content: bytes, page_indices: List[int]) -> bytes:
+    """A new PDF holding only the given 0-based pages of ``content``, in that order. Requires pypdf."""
+    reader = PdfReader(io.BytesIO(content))
+    writer = PdfWriter()
+    for index in page_indices:
+        writer.add_page(reader.pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _hash_pdf_object(obj, hasher, visiting: set) -> None:
+    """Feed a page's object graph to ``hasher`` independently of object numbers and file layout."""
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in visiting:
+            # Cycles (e.g. an annotation's /P back to its page)
+            hasher.update(b"<cycle>")
+            return
+        visiting.add(ref)
+        _hash_pdf_object(obj.get_object(), hasher, visiting)
+        visiting.discard(ref)
+    elif isinstance(obj, DictionaryObject):
+        hasher.update(b"<<")
+        for key in sorted(obj.keys()):
+            # /Parent leads to the page tree, i.e. to every other page
+            if key == "/Parent":
+                continue
+            hasher.update(key.encode("utf-8"))
+            _hash_pdf_object(obj.raw_get(key), hasher, visiting)
+        if isinstance(obj, StreamObject):
+            # Encoded bytes as stored; decoding would only cost time
+            hasher.update(b"stream")
+            hasher.update(getattr(obj, "_data", None) or obj.get_data())
+        hasher.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        hasher.update(b"[")
+        for item in obj:
+            _hash_pdf_object(item, hasher, visiting)
+        hasher.update(b"]")
+    else:
+        hasher.update(repr(obj).encode("utf-8"))
+
+
+def page_digests(content: bytes) -> Optional[List[str]]:
+    """
+    A SHA-256 per PDF page over its content streams, resources, size and
+    rotation. Unchanged pages keep their digest when other pages of the file
+    are edited and it is re-saved. Returns None when the PDF cannot be read.
+    """
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(content))
+        digests = []
+        for page in reader.pages:
+            hasher = hashlib.sha256()
+            _hash_pdf_object(page, hasher, set())
+            digests.append(hasher.hexdigest())
+        return digests
+    except Exception as exc:
+        logger.warning("Could not fingerprint PDF pages (%s); caching OCR per document only", exc)
+        return None
+
+
+# Words that carry no signal when matching a question to pages
+_STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me my of on or
+please provide show tell that the their there this to was what when where which who whose
+why will with you your extract find give list get document documents page pages
+""".split())
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in re.findall(r"\w+", text.lower()) if len(word) > 1 and word not in _STOPWORDS]
+
+
+def rank_pages(page_texts: List[Optional[str]], query: str, top_k: int) -> Optional[List[int]]:
+    """
+    0-based indices of the pages worth sending for ``query``, in page order, or
+    None when the document should be sent whole.
+
+    Pages are scored with BM25 over their text. The first page (usually the
+    account holder and summary) and pages without text to score are always
+    kept. Nothing is pruned when no page matches the query at all.
+    """
+    if len(page_texts) <= top_k:
+        return None
+    query_terms = set(_terms(query))
+    if not query_terms:
+        return None
+
+    page_terms = [Counter(_terms(text)) if text is not None else None for text in page_texts]
+    scored = [i for i, terms in enumerate(page_terms) if terms is not None]
+    if not scored:
+        return None
+    average_length = sum(sum(page_terms[i].values()) for i in scored) / len(scored) or 1.0
+    k1, b = 1.5, 0.75
+
+    scores = {}
+    for term in query_terms:
+        containing = sum(1 for i in scored if term in page_terms[i])
+        if not containing:
+            continue
+        idf = math.log(1 + (len(scored) - containing + 0.5) / (containing + 0.5))
+        for i in scored:
+            tf = page_terms[i][term]
+            if tf:
+                length = sum(page_terms[i].values())
+                scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+    if not scores:
+        return None
+
+    keep = {0} | {i for i, terms in enumerate(page_terms) if terms is None}
+    for i in sorted(scores, key=lambda i: scores[i], reverse=True):
+        if len(keep) >= top_k:
+            break
+        keep.add(i)
+    if len(keep) >= len(page_texts):
+        return None
+    return sorted(keep)
@@ -0,0 +1,432 @@
+import asyncio
+import contextvars
+import email.utils
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Deque, Dict, Optional
+
+import httpx
+
+from pdfqa_metrics import metrics
+
+# Status codes worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Failures that suggest the service itself is unhealthy, as opposed to rate limiting or a bad request
+OUTAGE_STATUS_CODES = {408, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at ``per_minute / 60`` per second.
+
+    ``acquire`` reserves immediately and sleeps off any deficit, so callers are
+    served in arrival order and a burst never overshoots the budget.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take ``amount`` tokens now and return how many seconds the caller must wait before using them."""
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        with self._lock:
+            self._refill_locked()
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, amount: float = 1.0) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge (negative) tokens once the real cost is known."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill_locked()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None and getattr(exc, "raw_response", None) is not None:
+        status = getattr(exc.raw_response, "status_code", None)
+    return status
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any."""
+    raw_response = getattr(exc, "raw_response", None)
+    headers = getattr(raw_response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_outage(exc: BaseException) -> bool:
+    return isinstance(exc, httpx.TransportError) or _status_code(exc) in OUTAGE_STATUS_CODES
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Mistral while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling Mistral after ``failure_threshold`` consecutive outage-type
+    failures (timeouts, connection errors, 5xx), so callers fail fast instead of
+    waiting out timeouts. After ``reset_timeout`` seconds one probe call is let
+    through; its success closes the breaker, its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _rejecting_locked(self) -> bool:
+        now = time.monotonic()
+        if self._opened_at is None:
+            return False
+        if self._probe_started is not None:
+            # A probe that never reported back (e.g. it was cancelled) is replaced after a while
+            return now - self._probe_started < self.reset_timeout
+        return now - self._opened_at < self.reset_timeout
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected."""
+        with self._lock:
+            return self._rejecting_locked()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._rejecting_locked():
+                raise CircuitOpenError("Mistral API circuit breaker is open; failing fast")
+            # Half-open: this caller is the probe
+            self._probe_started = time.monotonic()
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                metrics.increment("pdfqa.breaker.closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            probing = self._probe_started is not None
+            if probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if not probing:
+                    metrics.increment("pdfqa.breaker.opened")
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+    def trip(self) -> None:
+        """Open the breaker now, e.g. to exercise the offline path."""
+        with self._lock:
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+        metrics.increment("pdfqa.breaker.opened")
+
+
+class RequestScheduler:
+    """
+    Shared gate for every Mistral API call made by PDFQATool.
+
+    Requests and completion tokens are budgeted with token buckets. Rate-limit
+    and transient errors are retried with jittered exponential backoff, honouring
+    Retry-After; a 429 also pauses every caller, not just the one that hit it.
+    """
+
+    def __init__(self, requests_per_minute: float = 120, tokens_per_minute: float = 500000,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.breaker = breaker or CircuitBreaker()
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, min(max_delay, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _pause_remaining(self) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying ``exc``, or None if it should propagate."""
+        # Any response short of an outage shows the service is up
+        if _is_outage(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if attempt == self.max_retries or self.breaker.is_open:
+            return None
+        if isinstance(exc, httpx.TransportError):
+            return self._backoff(attempt)
+        status = _status_code(exc)
+        if status not in RETRYABLE_STATUS_CODES:
+            return None
+        retry_after = _retry_after(exc)
+        delay = retry_after if retry_after is not None else self._backoff(attempt)
+        if status == 429:
+            self._pause(delay)
+        return delay
+
+    def call(self, fn, *args, estimated_tokens: int = 0, **kwargs):
+        """Call ``fn(*args, **kwargs)`` within the budgets, retrying retryable failures."""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            time.sleep(self._pause_remaining())
+            self.requests.acquire(1)
+            self.tokens.acquire(estimated_tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.record_success()
+                return result
+            # The failed attempt's tokens were not spent by the provider
+            self.tokens.adjust(estimated_tokens)
+            time.sleep(delay)
+
+    async def acall(self, fn, *args, estimated_tokens: int = 0, **kwargs):
+        """Async ``call``: awaits ``fn(*args, **kwargs)`` and sleeps on the event loop instead of blocking."""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            await asyncio.sleep(self._pause_remaining())
+            await asyncio.sleep(self.requests.reserve(1))
+            await asyncio.sleep(self.tokens.reserve(estimated_tokens))
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.record_success()
+                return result
+            self.tokens.adjust(estimated_tokens)
+            await asyncio.sleep(delay)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token budget with the usage reported by the provider."""
+        if actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Process-wide scheduler shared by all PDFQATool instances, configured from MISTRAL_* env vars."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler(
+                    requests_per_minute=float(os.getenv("MISTRAL_RPM", "120")),
+                    tokens_per_minute=float(os.getenv("MISTRAL_TPM", "500000")),
+                    max_retries=int(os.getenv("MISTRAL_MAX_RETRIES", "5")),
+                    breaker=CircuitBreaker(
+                        failure_threshold=int(os.getenv("MISTRAL_BREAKER_THRESHOLD", "5")),
+                        reset_timeout=float(os.getenv("MISTRAL_BREAKER_RESET", "30")),
+                    ),
+                )
+    return _scheduler
+
+
+def set_scheduler(scheduler: RequestScheduler) -> None:
+    """Replace the shared scheduler, e.g. to apply different budgets at runtime."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+
+def _spawn(fn) -> Future:
+    """Run ``fn`` on its own daemon thread, in a copy of the caller's context."""
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class HedgePolicy:
+    """
+    Hedged requests: if a call is still running after the ``percentile`` latency
+    of recent calls with the same key, a duplicate is sent and whichever
+    succeeds first is used.
+
+    Hedges are capped at ``max_extra_fraction`` of all calls, so the extra
+    spend stays bounded. Nothing is hedged until ``min_samples`` latencies have
+    been seen for a key.
+    """
+
+    def __init__(self, percentile: float = 95.0, max_extra_fraction: float = 0.1, min_samples: int = 20,
+                 min_delay: float = 1.0, window: int = 200):
+        self.percentile = percentile
+        self.max_extra_fraction = max_extra_fraction
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call with ``key``, or None while there is too little history."""
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        rank = max(0, math.ceil(self.percentile / 100.0 * len(samples)) - 1)
+        return max(self.min_delay, samples[rank])
+
+    def _observe(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self._calls += 1
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self._hedges + 1 > self.max_extra_fraction * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def call(self, key: str, fn):
+        """``fn()``, hedged by a second ``fn()`` if it is slower than usual. The losing call is left to finish."""
+        self._start_call()
+        delay = self.delay(key)
+        started = time.monotonic()
+        if delay is None:
+            result = fn()
+            self._observe(key, time.monotonic() - started)
+            return result
+
+        primary = _spawn(fn)
+        if not wait([primary], timeout=delay).done and self._take_budget():
+            metrics.increment("pdfqa.hedge.fired")
+            hedge = _spawn(fn)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            metrics.increment("pdfqa.hedge.won")
+                        self._observe(key, time.monotonic() - started)
+                        return future.result()
+        result = primary.result()
+        self._observe(key, time.monotonic() - started)
+        return result
+
+    async def acall(self, key: str, coro_fn):
+        """Async ``call``; the losing request is cancelled rather than left running."""
+        self._start_call()
+        delay = self.delay(key)
+        started = time.monotonic()
+        if delay is None:
+            result = await coro_fn()
+            self._observe(key, time.monotonic() - started)
+            return result
+
+        primary = asyncio.ensure_future(coro_fn())
+        tasks = {primary}
+        try:
+            await asyncio.wait(tasks, timeout=delay)
+            if not primary.done() and self._take_budget():
+                metrics.increment("pdfqa.hedge.fired")
+                hedge = asyncio.ensure_future(coro_fn())
+                tasks.add(hedge)
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is hedge:
+                                metrics.increment("pdfqa.hedge.won")
+                            self._observe(key, time.monotonic() - started)
+                            return task.result()
+            result = await primary
+            self._observe(key, time.monotonic() - started)
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+_hedge_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> Optional[HedgePolicy]:
+    """
+    Process-wide hedging policy, or None (no hedging) unless PDFQA_HEDGE_PERCENTILE is set.
+    PDFQA_HEDGE_MAX_EXTRA caps hedges as a fraction of calls.
+    """
+    global _hedge_policy
+    if _hedge_policy is None and os.getenv("PDFQA_HEDGE_PERCENTILE"):
+        with _scheduler_lock:
+            if _hedge_policy is None:
+                _hedge_policy = HedgePolicy(
+                    percentile=float(os.getenv("PDFQA_HEDGE_PERCENTILE")),
+                    max_extra_fraction=float(os.getenv("PDFQA_HEDGE_MAX_EXTRA", "0.1")),
+                )
+    return _hedge_policy
@@ -0,0 +1,315 @@
+"""
+Offline stand-in for the Mistral API endpoints PDFQATool uses.
+
+Serves file upload / signed URL / delete, chat completions (blocking and
+streamed), and OCR with canned but well-formed responses. Latency, slow
+tails and errors can be injected, so the whole tool path can be benchmarked
+and load-tested without network access:
+
+    python pdfqa_standin.py --port 8089 --latency 0.3 --error-rate 0.05
+    MISTRAL_SERVER_URL=http://127.0.0.1:8089 MISTRAL_API_KEY=standin python ...
+"""
+import argparse
+import email.parser
+import email.policy
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is optional; without it stand-in OCR reports one synthetic page
+    PdfReader = None
+
+
+class StandInSettings(BaseModel):
+    """Latency and failure injection for the stand-in server."""
+    latency: float = Field(default=0.0, description="Base seconds added to every API response")
+    jitter: float = Field(default=0.0, description="Uniform random extra seconds, 0..jitter")
+    slow_rate: float = Field(default=0.0, ge=0, le=1, description="Fraction of responses delayed by slow_latency")
+    slow_latency: float = Field(default=5.0, description="Extra seconds for slow responses, to simulate tail latency")
+    error_rate: float = Field(default=0.0, ge=0, le=1, description="Fraction of API requests answered with error_status")
+    error_status: int = 503
+    stream_chunk_delay: float = Field(default=0.02, description="Seconds between streamed completion chunks")
+
+
+def _schema_instance(schema: dict, definitions: dict):
+    """Smallest JSON value satisfying a (pydantic-generated) JSON schema."""
+    if "$ref" in schema:
+        return _schema_instance(definitions.get(schema["$ref"].split("/")[-1], {}), definitions)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if schema.get(key):
+            return _schema_instance(schema[key][0], definitions)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _schema_instance(prop, definitions) for name, prop in schema.get("properties", {}).items()}
+    return {"string": "", "number": 0.0, "integer": 0, "boolean": False, "array": [], "null": None}.get(kind)
+
+
+def _prompt_text(messages: List[dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(chunk.get("text", "") for chunk in content if chunk.get("type") == "text")
+    return "\n".join(parts)
+
+
+def canned_answer(request: dict) -> str:
+    """Deterministic reply in the shape the request asks for."""
+    prompt = _prompt_text(request.get("messages", []))
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        json_schema = response_format.get("json_schema", {})
+        schema = json_schema.get("schema") or json_schema.get("schema_definition") or {}
+        return json.dumps(_schema_instance(schema, schema.get("$defs", {})))
+    if response_format.get("type") == "json_object":
+        ids = sorted(set(re.findall(r"\b(q\d+)\b", prompt)), key=lambda qid: int(qid[1:]))
+        return json.dumps({qid: f"stand-in answer {qid}" for qid in ids})
+    answer = f"Stand-in answer for a {len(prompt)}-character prompt."
+    if "CONFIDENCE:" in prompt:
+        answer += "\nCONFIDENCE: high"
+    return answer
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    server: "StandInServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- Plumbing ---
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self) -> bool:
+        """Apply configured latency; returns True (after replying) when this request should fail."""
+        settings = self.server.settings
+        delay = settings.latency + random.uniform(0, settings.jitter)
+        if random.random() < settings.slow_rate:
+            delay += settings.slow_latency
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < settings.error_rate:
+            self._send_json(settings.error_status, {"object": "error", "message": "Injected stand-in error"})
+            return True
+        return False
+
+    # --- Routing ---
+
+    def do_GET(self):
+        match = re.fullmatch(r"/standin/files/([\w-]+)", self.path.split("?")[0])
+        if match:
+            return self._serve_file(match.group(1))
+        match = re.fullmatch(r"/v1/files/([\w-]+)/url", self.path.split("?")[0])
+        if match:
+            return self._sign(match.group(1))
+        self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/files":
+            return self._upload()
+        if path == "/v1/chat/completions":
+            return self._complete()
+        if path == "/v1/ocr":
+            return self._ocr()
+        self._send_json(404, {"message": "Not found"})
+
+    def do_DELETE(self):
+        match = re.fullmatch(r"/v1/files/([\w-]+)", self.path.split("?")[0])
+        if not match:
+            return self._send_json(404, {"message": "Not found"})
+        if self._inject():
+            return
+        deleted = self.server.files.pop(match.group(1), None) is not None
+        if not deleted:
+            return self._send_json(404, {"message": "No such file"})
+        self._send_json(200, {"id": match.group(1), "object": "file", "deleted": True})
+
+    # --- Endpoints ---
+
+    def _upload(self):
+        body = self._body()
+        if self._inject():
+            return
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("latin-1") + body
+        )
+        file_name, content = "upload", b""
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                file_name = part.get_filename() or file_name
+                content = part.get_payload(decode=True) or b""
+        file_id = str(uuid.uuid4())
+        self.server.files[file_id] = (file_name, content)
+        self._send_json(200, {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": file_name, "purpose": "ocr", "sample_type": "ocr_input", "source": "upload",
+        })
+
+    def _sign(self, file_id: str):
+        if self._inject():
+            return
+        if file_id not in self.server.files:
+            return self._send_json(404, {"message": "No such file"})
+        self._send_json(200, {"url": f"{self.server.url}/standin/files/{file_id}"})
+
+    def _serve_file(self, file_id: str):
+        stored = self.server.files.get(file_id)
+        if stored is None:
+            return self._send_json(404, {"message": "No such file"})
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(stored[1])))
+        self.end_headers()
+        self.wfile.write(stored[1])
+
+    def _complete(self):
+        request = json.loads(self._body() or b"{}")
+        if self._inject():
+            return
+        answer = canned_answer(request)
+        usage = {
+            "prompt_tokens": max(1, len(json.dumps(request.get("messages", []))) // 4),
+            "completion_tokens": max(1, len(answer) // 4),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id, model, created = uuid.uuid4().hex, request.get("model", "stand-in"), int(time.time())
+
+        if not request.get("stream"):
+            return self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "model": model, "created": created,
+                "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = re.findall(r"\S+\s*", answer) or [answer]
+        for number, piece in enumerate(pieces):
+            last = number == len(pieces) - 1
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "model": model, "created": created,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                             "finish_reason": "stop" if last else None}],
+            }
+            if last:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.settings.stream_chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _ocr(self):
+        request = json.loads(self._body() or b"{}")
+        if self._inject():
+            return
+        document = request.get("document", {})
+        url = document.get("document_url") or document.get("image_url") or ""
+        match = re.search(r"/standin/files/([\w-]+)", url)
+        content = self.server.files.get(match.group(1), ("", b""))[1] if match else b""
+        page_texts = _pdf_page_texts(content) if document.get("type") == "document_url" else ["[image]"]
+        indices = request.get("pages") or range(len(page_texts))
+        pages = [
+            {"index": index, "markdown": page_texts[index] if index < len(page_texts) else "",
+             "images": [], "dimensions": {"dpi": 200, "height": 2200, "width": 1700}}
+            for index in indices
+        ]
+        self._send_json(200, {
+            "pages": pages, "model": request.get("model", "stand-in-ocr"),
+            "usage_info": {"pages_processed": len(pages), "doc_size_bytes": len(content)},
+        })
+
+
+def _pdf_page_texts(content: bytes) -> List[str]:
+    if PdfReader is not None and content:
+        try:
+            reader = PdfReader(io.BytesIO(content))
+            return [f"Page {n + 1}\n{page.extract_text() or ''}".strip() for n, page in enumerate(reader.pages)]
+        except Exception:
+            pass
+    return ["Page 1\nStand-in OCR text"]
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    The stand-in, runnable in the background of a test or benchmark:
+
+        with StandInServer(StandInSettings(latency=0.2)) as server:
+            configure_mistral_client(server_url=server.url)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, settings: Optional[StandInSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _StandInHandler)
+        self.settings = settings or StandInSettings()
+        self.files: Dict[str, Tuple[str, bytes]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="pdfqa-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Mistral endpoints used by PDFQATool")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    for name, field in StandInSettings.model_fields.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(field.default), default=field.default,
+                            help=field.description)
+    args = parser.parse_args()
+    settings = StandInSettings(**{name: getattr(args, name) for name in StandInSettings.model_fields})
+    server = StandInServer(settings, host=args.host, port=args.port)
+    print(f"Mistral stand-in listening; set MISTRAL_SERVER_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
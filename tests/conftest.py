@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Caches, the file registry and the sweeper are configured from the environment at import time
+os.environ.setdefault("PDFQA_CACHE_DIR", tempfile.mkdtemp(prefix="pdfqa-tests-"))
+os.environ.setdefault("PDFQA_FILE_SWEEP_INTERVAL", "0")
+os.environ.setdefault("MISTRAL_API_KEY", "standin")
+
+from pdfqa_metrics import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    """Counters start at zero in every test, so tests can assert on them."""
+    metrics.reset()
+    yield metrics
@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("crewai")
+pytest.importorskip("crewai_tools")
+pytest.importorskip("yaml")
+
+
+@pytest.fixture(scope="module")
+def mortgage_crew():
+    # The module reads its YAML configuration relative to the working directory
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    previous = os.getcwd()
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    os.chdir(repo_root)
+    try:
+        import mortgage_crew
+    finally:
+        os.chdir(previous)
+    return mortgage_crew
+
+
+@pytest.fixture
+def builder(mortgage_crew):
+    built_once = mortgage_crew._built_once
+
+    class Builder:
+        def __init__(self):
+            self._built = {}
+            self._build_lock = threading.RLock()
+            self.builds = []
+
+        @built_once
+        def agent(self):
+            self.builds.append("agent")
+            return object()
+
+        @built_once
+        def crew(self, validation_only=False):
+            self.builds.append(("crew", validation_only))
+            return object()
+
+    return Builder()
+
+
+def test_builders_run_once_per_instance(builder):
+    assert builder.agent() is builder.agent()
+    assert builder.builds == ["agent"]
+
+
+def test_equivalent_calls_share_one_entry(builder):
+    crew = builder.crew()
+    assert builder.crew(False) is crew
+    assert builder.crew(validation_only=False) is crew
+    assert builder.builds == [("crew", False)]
+
+
+def test_different_arguments_build_different_objects(builder):
+    assert builder.crew(True) is not builder.crew(False)
+    assert builder.crew(validation_only=True) is builder.crew(True)
+    assert builder.builds == [("crew", True), ("crew", False)]
+
+
+def test_methods_with_the_same_arguments_do_not_collide(builder):
+    assert builder.agent() is not builder.crew()
+
+
+def test_concurrent_first_calls_build_once(builder):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        crews = list(executor.map(lambda _: builder.crew(), range(16)))
+    assert all(crew is crews[0] for crew in crews)
+    assert builder.builds == [("crew", False)]
+
+
+def test_unknown_arguments_are_rejected(builder):
+    with pytest.raises(TypeError):
+        builder.crew(validation=True)
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pdfqa_cache import AnswerCache, OCRCache, SingleFlight, UploadCache
+
+
+def test_concurrent_calls_with_one_key_run_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(None)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", work)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", work)
+        time.sleep(0.05)
+        release.set()
+        assert leader.result() == ("answer", False)
+        assert follower.result() == ("answer", True)
+    assert len(calls) == 1
+
+
+def test_errors_are_shared_with_waiting_callers():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def work():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", work)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", work)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_nothing_is_remembered_after_a_flight_lands():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+
+
+def test_async_callers_share_one_task_and_cancel_it_only_when_all_leave():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        results = await asyncio.gather(flight.ado("key", work), flight.ado("key", work), flight.ado("other", work))
+        assert results == [("answer", False), ("answer", True), ("answer", False)]
+
+        # One of two waiters cancelled: the shared work still completes for the other
+        first = asyncio.ensure_future(flight.ado("key", work))
+        second = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == ("answer", True)
+
+    asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_answer_cache_expires_entries(tmp_path):
+    cache = AnswerCache(directory=str(tmp_path), ttl=0.05)
+    key = AnswerCache.make_key(["digest"], "What is the income?", "model", 0.0)
+    cache.put(key, "42")
+    assert cache.get(key) == "42"
+    # Trivially different phrasings share the key
+    assert AnswerCache.make_key(["digest"], "what is the  income", "model", 0.0) == key
+    time.sleep(0.06)
+    assert cache.get(key) is None
+
+
+def test_ocr_pages_are_cached_apart_from_documents(tmp_path):
+    cache = OCRCache(directory=str(tmp_path))
+    cache.put_page("engine", "page-digest", "page text")
+    assert cache.get_page("engine", "page-digest") == "page text"
+    assert cache.get_page("other-engine", "page-digest") is None
+    assert cache.get("engine", "page-digest") is None
+
+
+def test_upload_cache_drops_every_entry_of_a_deleted_file(tmp_path):
+    cache = UploadCache(path=str(tmp_path / "uploads.json"))
+    expires_at = time.time() + 3600
+    cache.put("a", "file-1", "https://signed/a", expires_at)
+    cache.put("a:small", "file-1", "https://signed/a", expires_at)
+    cache.put("b", "file-2", "https://signed/b", expires_at)
+    cache.invalidate_file("file-1")
+    assert set(UploadCache(path=str(tmp_path / "uploads.json")).entries()) == {"b"}
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+pytest.importorskip("mistralai")
+
+from pdfqa_cache import UploadCache  # noqa: E402
+from pdfqa_files import FileRegistry, FileSweeper  # noqa: E402
+from pdfqa_metrics import metrics  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return UploadCache(path=str(tmp_path / "uploads.json"))
+
+
+def make_registry(tmp_path, cache, **kwargs) -> FileRegistry:
+    return FileRegistry(path=str(tmp_path / "files.json"), cache=cache, **kwargs)
+
+
+def upload(registry, cache, upload_key, file_id):
+    cache.put(upload_key, file_id, f"https://signed/{file_id}", time.time() + 3600)
+    registry.register(file_id, upload_key)
+
+
+def test_files_in_use_are_never_claimed(tmp_path, cache):
+    registry = make_registry(tmp_path, cache, retention=0)
+    with registry.track() as held:
+        upload(registry, cache, "a", "file-a")
+        assert held == {"file-a"}
+        assert registry.claim_collectable(10) == []
+    time.sleep(0.01)
+    assert registry.claim_collectable(10) == ["file-a"]
+    # Claimed files leave the registry and the upload cache, so no new call reuses them
+    assert len(registry) == 0
+    assert cache.get("a") is None
+
+
+def test_files_are_kept_for_the_retention_period(tmp_path, cache):
+    registry = make_registry(tmp_path, cache, retention=3600)
+    with registry.track():
+        upload(registry, cache, "a", "file-a")
+    assert registry.claim_collectable(10) == []
+
+
+def test_orphaned_files_are_claimed_after_the_grace_period(tmp_path, cache):
+    registry = make_registry(tmp_path, cache, retention=3600, orphan_grace=0)
+    with registry.track():
+        upload(registry, cache, "a", "file-a")
+        upload(registry, cache, "b", "file-b")
+    cache.invalidate("b")
+    time.sleep(0.01)
+    assert registry.claim_collectable(10) == ["file-b"]
+
+
+def test_claims_are_limited_and_least_recently_used_first(tmp_path, cache):
+    registry = make_registry(tmp_path, cache, retention=0)
+    for name in ("a", "b", "c"):
+        with registry.track():
+            upload(registry, cache, name, f"file-{name}")
+        time.sleep(0.01)
+    with registry.track():
+        registry.use("file-a")
+    time.sleep(0.01)
+    assert registry.claim_collectable(2) == ["file-b", "file-c"]
+    assert registry.claim_collectable(2) == ["file-a"]
+
+
+def test_files_from_earlier_runs_are_adopted(tmp_path, cache):
+    cache.put("old", "file-old", "https://signed/old", time.time() - 3600)
+    registry = make_registry(tmp_path, cache, retention=3600)
+    assert len(registry) == 1
+    assert registry.claim_collectable(10) == ["file-old"]
+
+
+def test_registry_state_survives_a_restart(tmp_path, cache):
+    registry = make_registry(tmp_path, cache, retention=3600)
+    with registry.track():
+        upload(registry, cache, "a", "file-a")
+    assert len(make_registry(tmp_path, cache, retention=3600)) == 1
+
+
+def test_sweeper_deletes_in_batches_and_restores_failures(tmp_path, cache, monkeypatch):
+    registry = make_registry(tmp_path, cache, retention=0)
+    for index in range(5):
+        with registry.track():
+            upload(registry, cache, f"key-{index}", f"file-{index}")
+    time.sleep(0.01)
+
+    sweeper = FileSweeper(registry, interval=0, batch_size=2)
+    deleted = []
+
+    def delete(file_id):
+        if file_id == "file-4":
+            registry.restore(file_id)
+            return False
+        deleted.append(file_id)
+        return True
+
+    monkeypatch.setattr(sweeper, "_delete", delete)
+    assert sweeper.sweep() == 4
+    assert sorted(deleted) == ["file-0", "file-1", "file-2", "file-3"]
+    assert metrics.counter("pdfqa.files.deleted") == 4
+    assert metrics.counter("pdfqa.files.delete_failed") == 1
+    # The failed delete is retried on the next sweep
+    assert len(registry) == 1
@@ -0,0 +1,100 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from pdfqa_metrics import metrics
+from pdfqa_mirror import UrlMirror
+
+
+class Origin(ThreadingHTTPServer):
+    """Serves ``content`` with an ETag and answers matching conditional GETs with 304."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _OriginHandler)
+        self.content = b"version 1"
+        self.etag = '"v1"'
+        self.requests = []
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/statement.pdf"
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    server: Origin
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(self.server.content)))
+        self.end_headers()
+        self.wfile.write(self.server.content)
+
+
+@pytest.fixture
+def origin():
+    server = Origin()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_recently_checked_copies_are_served_without_contacting_the_origin(tmp_path, origin):
+    mirror = UrlMirror(directory=str(tmp_path), max_age=300)
+    assert mirror.fetch(origin.url) == b"version 1"
+    assert mirror.fetch(origin.url) == b"version 1"
+    assert len(origin.requests) == 1
+    assert metrics.counter("pdfqa.mirror.fresh") == 1
+
+
+def test_older_copies_are_revalidated_with_their_etag(tmp_path, origin):
+    mirror = UrlMirror(directory=str(tmp_path), max_age=0)
+    mirror.fetch(origin.url)
+    assert mirror.fetch(origin.url) == b"version 1"
+    assert origin.requests[1].get("If-None-Match") == '"v1"'
+    assert metrics.counter("pdfqa.mirror.not_modified") == 1
+    assert metrics.counter("pdfqa.mirror_fetch.count") == 2
+
+
+def test_changed_documents_are_downloaded_again(tmp_path, origin):
+    mirror = UrlMirror(directory=str(tmp_path), max_age=0)
+    mirror.fetch(origin.url)
+    origin.content, origin.etag = b"version 2", '"v2"'
+    assert mirror.fetch(origin.url) == b"version 2"
+    # A new mirror instance reads the updated copy and its new ETag from disk
+    assert UrlMirror(directory=str(tmp_path), max_age=0).fetch(origin.url) == b"version 2"
+    assert origin.requests[-1].get("If-None-Match") == '"v2"'
+
+
+def test_last_good_copy_is_served_while_the_origin_is_down(tmp_path, origin):
+    mirror = UrlMirror(directory=str(tmp_path), max_age=0, timeout=1)
+    url = origin.url
+    mirror.fetch(url)
+    origin.shutdown()
+    origin.server_close()
+    assert mirror.fetch(url) == b"version 1"
+    assert metrics.counter("pdfqa.mirror.stale") == 1
+
+
+def test_unreachable_documents_without_a_copy_raise(tmp_path, origin):
+    url = origin.url
+    origin.shutdown()
+    origin.server_close()
+    with pytest.raises(httpx.HTTPError):
+        UrlMirror(directory=str(tmp_path), timeout=1).fetch(url)
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from pdfqa_preprocess import rank_pages
+
+pypdf = pytest.importorskip("pypdf")
+
+from pdfqa_preprocess import page_digests, subset_pdf  # noqa: E402
+
+
+def pdf_bytes(widths) -> bytes:
+    """A PDF of blank pages; the width tells pages apart."""
+    writer = pypdf.PdfWriter()
+    for width in widths:
+        writer.add_blank_page(width=width, height=800)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+PAGES = [
+    "Account holder Jane Doe statement summary",
+    "Card payment coffee shop groceries",
+    "Card payment coffee shop groceries",
+    "Salary payment from Acme Ltd monthly income",
+    "Card payment coffee shop groceries",
+    "Mortgage payment to Example Bank",
+]
+
+
+def test_short_documents_are_not_pruned():
+    assert rank_pages(PAGES, "salary income", top_k=len(PAGES)) is None
+
+
+def test_best_matching_pages_are_kept_with_the_first_page():
+    assert rank_pages(PAGES, "What is the monthly salary income?", top_k=2) == [0, 3]
+
+
+def test_pages_come_back_in_document_order():
+    assert rank_pages(PAGES, "mortgage payment and salary", top_k=3) == [0, 3, 5]
+
+
+def test_nothing_is_pruned_when_no_page_matches():
+    assert rank_pages(PAGES, "passport number", top_k=2) is None
+    assert rank_pages(PAGES, "what is the", top_k=2) is None
+
+
+def test_pages_without_text_are_always_kept():
+    pages = PAGES[:3] + [None] + PAGES[3:]
+    assert rank_pages(pages, "salary income", top_k=3) == [0, 3, 4]
+
+
+def test_unchanged_pages_keep_their_digest_across_files():
+    first = page_digests(pdf_bytes([600, 601, 602]))
+    edited = page_digests(pdf_bytes([600, 601, 700, 603]))
+    assert first[:2] == edited[:2]
+    assert first[2] != edited[2]
+    assert len(set(first)) == 3
+
+
+def test_digests_survive_page_extraction():
+    content = pdf_bytes([600, 601, 602])
+    assert page_digests(subset_pdf(content, [2, 0])) == [page_digests(content)[2], page_digests(content)[0]]
+
+
+def test_unreadable_pdf_has_no_digests():
+    assert page_digests(b"not a pdf") is None
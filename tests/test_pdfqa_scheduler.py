@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pdfqa_metrics import metrics
+from pdfqa_scheduler import CircuitBreaker, CircuitOpenError, HedgePolicy, RequestScheduler, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def failing(statuses, result="ok"):
+    """A callable raising ``StatusError`` for each status in turn, then returning ``result``."""
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= len(statuses):
+            raise StatusError(statuses[len(calls) - 1])
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+# --- Token bucket ---------------------------------------------------------------
+
+
+def test_token_bucket_serves_its_capacity_then_makes_callers_wait():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(2) == pytest.approx(3.0, abs=0.05)
+
+
+def test_token_bucket_adjust_returns_unspent_tokens():
+    bucket = TokenBucket(per_minute=60)
+    bucket.reserve(60)
+    bucket.adjust(30)
+    assert bucket.reserve(30) == 0.0
+    assert bucket.reserve(1) > 0
+
+
+def test_zero_rate_bucket_never_throttles():
+    assert TokenBucket(per_minute=0).reserve(1000) == 0.0
+
+
+# --- Retries --------------------------------------------------------------------
+
+
+def test_retryable_errors_are_retried_until_success():
+    scheduler = RequestScheduler(base_delay=0, max_retries=3)
+    fn = failing([429, 503])
+    assert scheduler.call(fn) == "ok"
+    assert len(fn.calls) == 3
+
+
+def test_non_retryable_errors_propagate_immediately():
+    scheduler = RequestScheduler(base_delay=0, max_retries=3)
+    fn = failing([400])
+    with pytest.raises(StatusError):
+        scheduler.call(fn)
+    assert len(fn.calls) == 1
+
+
+def test_retries_stop_after_max_retries():
+    scheduler = RequestScheduler(base_delay=0, max_retries=2, breaker=CircuitBreaker(failure_threshold=100))
+    fn = failing([503] * 10)
+    with pytest.raises(StatusError):
+        scheduler.call(fn)
+    assert len(fn.calls) == 3
+
+
+def test_async_calls_are_retried_too():
+    scheduler = RequestScheduler(base_delay=0, max_retries=3)
+    fn = failing([502])
+
+    async def coro_fn():
+        return fn()
+
+    assert asyncio.run(scheduler.acall(coro_fn)) == "ok"
+    assert len(fn.calls) == 2
+
+
+# --- Circuit breaker ------------------------------------------------------------
+
+
+def test_breaker_opens_after_consecutive_outages_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    scheduler = RequestScheduler(base_delay=0, max_retries=5, breaker=breaker)
+    fn = failing([503] * 10)
+    with pytest.raises(StatusError):
+        scheduler.call(fn)
+    # The second outage opened the breaker, so no further retries were made
+    assert len(fn.calls) == 2
+    assert breaker.is_open
+    assert metrics.counter("pdfqa.breaker.opened") == 1
+    with pytest.raises(CircuitOpenError):
+        scheduler.call(fn)
+    assert len(fn.calls) == 2
+
+
+def test_rate_limiting_does_not_count_as_an_outage():
+    breaker = CircuitBreaker(failure_threshold=2)
+    scheduler = RequestScheduler(base_delay=0, max_retries=5, breaker=breaker)
+    assert scheduler.call(failing([429, 429, 429])) == "ok"
+    assert not breaker.is_open
+
+
+def test_breaker_lets_one_probe_through_after_the_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    breaker.before_call()
+    # While the probe is in flight other callers are still rejected
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert metrics.counter("pdfqa.breaker.closed") == 1
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.is_open
+
+
+# --- Hedging --------------------------------------------------------------------
+
+
+def warmed_policy(key="model:1024", **kwargs) -> HedgePolicy:
+    policy = HedgePolicy(min_samples=3, min_delay=0.02, max_extra_fraction=1.0, **kwargs)
+    for _ in range(3):
+        policy.call(key, lambda: time.sleep(0.01))
+    return policy
+
+
+def slow_then_fast():
+    """First call takes a second, later calls return at once."""
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        if first:
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    fn.calls = calls
+    return fn
+
+
+def test_no_hedging_until_enough_latencies_are_seen():
+    policy = HedgePolicy(min_samples=3)
+    assert policy.delay("model:1024") is None
+    policy.call("model:1024", lambda: None)
+    assert policy.delay("model:1024") is None
+
+
+def test_slow_call_is_hedged_and_the_hedge_wins():
+    policy = warmed_policy()
+    fn = slow_then_fast()
+    started = time.monotonic()
+    assert policy.call("model:1024", fn) == "fast"
+    assert time.monotonic() - started < 0.5
+    assert len(fn.calls) == 2
+    assert metrics.counter("pdfqa.hedge.fired") == 1
+    assert metrics.counter("pdfqa.hedge.won") == 1
+
+
+def test_history_is_kept_per_key():
+    policy = warmed_policy(key="model:1024")
+    assert policy.delay("model:1024") is not None
+    assert policy.delay("model:65536") is None
+    assert policy.delay("other-model:1024") is None
+
+
+def test_hedges_are_capped_by_the_budget():
+    policy = warmed_policy()
+    policy.max_extra_fraction = 0.0
+    fn = slow_then_fast()
+    assert policy.call("model:1024", fn) == "slow"
+    assert len(fn.calls) == 1
+    assert metrics.counter("pdfqa.hedge.fired") == 0
+
+
+def test_async_hedge_cancels_the_losing_request():
+    policy = warmed_policy()
+    cancelled = []
+    calls = []
+
+    async def coro_fn():
+        calls.append(None)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "slow"
+        return "fast"
+
+    async def run():
+        result = await policy.acall("model:1024", coro_fn)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert cancelled == [True]
+    assert metrics.counter("pdfqa.hedge.won") == 1
@@ -0,0 +1,222 @@
+"""
+End-to-end tests of PDFQATool against the offline stand-in server
+(pdfqa_standin): the sync and async entry points, model tiers, sharding,
+structured output, the offline fallback, call coalescing, page-level OCR
+reuse and duplicate files. Replies can be scripted per test with ``replies``.
+"""
+import asyncio
+import itertools
+import json
+import shutil
+from typing import Optional
+
+import pytest
+
+pytest.importorskip("crewai")
+pytest.importorskip("mistralai")
+pypdf = pytest.importorskip("pypdf")
+
+from pydantic import BaseModel  # noqa: E402
+
+import pdfqa_standin  # noqa: E402
+from pdfqa_client import configure_mistral_client  # noqa: E402
+from pdfqa_metrics import metrics  # noqa: E402
+from pdfqa_scheduler import get_scheduler  # noqa: E402
+from pdfqa_standin import StandInServer, StandInSettings  # noqa: E402
+from PDFQATool import PDFQATool  # noqa: E402
+
+
+class Applicant(BaseModel):
+    name: str
+    annual_income: Optional[float] = None
+
+
+# Page widths are never reused, so no test sees pages cached by another
+_widths = itertools.count(600)
+
+
+def write_pdf(path, widths=None, pages: int = 1) -> str:
+    """A PDF of blank pages; distinct widths make distinct page content."""
+    writer = pypdf.PdfWriter()
+    for width in widths or [next(_widths) for _ in range(pages)]:
+        writer.add_blank_page(width=width, height=800)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def server():
+    with StandInServer(StandInSettings(stream_chunk_delay=0)) as standin:
+        configure_mistral_client(server_url=standin.url)
+        yield standin
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """
+    Chat completion requests the stand-in received, in order. Assign
+    ``replies.script = fn(request) -> str | None`` to answer instead of the
+    stand-in's canned reply (None falls back to it).
+    """
+    canned_answer = pdfqa_standin.canned_answer
+
+    class Recorder(list):
+        script = None
+
+        def __call__(self, request):
+            self.append(request)
+            scripted = self.script(request) if self.script is not None else None
+            return scripted if scripted is not None else canned_answer(request)
+
+    recorder = Recorder()
+    monkeypatch.setattr(pdfqa_standin, "canned_answer", recorder)
+    return recorder
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    return [write_pdf(tmp_path / f"doc{number}.pdf") for number in range(3)]
+
+
+def prompt(request) -> str:
+    return pdfqa_standin._prompt_text(request["messages"])
+
+
+def run(tool: PDFQATool, use_async: bool, **kwargs) -> str:
+    return asyncio.run(tool._arun(**kwargs)) if use_async else tool._run(**kwargs)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_simple_question_is_answered_by_the_lower_tier(server, replies, pdfs, use_async):
+    tool = PDFQATool(model_tiers=["mistral-small-latest"])
+    answer = run(tool, use_async, paths=pdfs[:1], question=f"What is the income (async={use_async})?")
+    assert answer.startswith("Stand-in answer")
+    assert "CONFIDENCE" not in answer
+    assert [request["model"] for request in replies] == ["mistral-small-latest"]
+    assert metrics.counter("pdfqa.ocr.count") == 1
+    assert metrics.counter("pdfqa.tier.mistral-small-latest.answered") == 1
+
+
+def test_unsure_lower_tier_escalates_to_the_main_model(server, replies, pdfs):
+    replies.script = lambda request: "Not sure.\nCONFIDENCE: low" if "small" in request["model"] else None
+    tool = PDFQATool(model_tiers=["mistral-small-latest"])
+    answer = tool._run(paths=pdfs[:1], question="What is the applicant's employer?")
+    assert answer.startswith("Stand-in answer")
+    assert [request["model"] for request in replies] == ["mistral-small-latest", tool.model]
+    assert metrics.counter("pdfqa.tier.mistral-small-latest.escalated") == 1
+
+
+def test_repeated_questions_come_from_the_answer_cache(server, replies, pdfs):
+    tool = PDFQATool(model_tiers=[])
+    first = tool._run(paths=pdfs[:2], question="Who is the applicant?")
+    second = asyncio.run(tool._arun(paths=pdfs[:2], question="who is the applicant"))
+    assert first == second
+    assert len(replies) == 1
+    assert metrics.counter("pdfqa.answer_cache.hit") == 1
+
+
+def test_answers_are_streamed_to_the_callback(server, replies, pdfs):
+    streamed = []
+    tool = PDFQATool(stream_callback=streamed.append)
+    answer = tool._run(paths=pdfs[:1], question="Extract name and DOB from ID")
+    assert "".join(streamed).strip() == answer
+    assert metrics.snapshot()["pdfqa.first_token.seconds"]["count"] == 1
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_sharded_call_answers_each_group_then_merges(server, replies, pdfs, use_async):
+    tool = PDFQATool(max_files_per_call=1, model_tiers=[])
+    answer = run(tool, use_async, paths=pdfs, question=f"Which lender is named (async={use_async})?")
+    assert answer.startswith("Stand-in answer")
+    # One completion per group of files, then one to merge them
+    assert len(replies) == 4
+    assert metrics.counter("pdfqa.completion.count") == 4
+    merge_prompt = prompt(replies[-1])
+    assert "answered separately for 3 groups" in merge_prompt
+    for number, shard_request in enumerate(replies[:3], start=1):
+        assert f"=== Group {number} (doc{number - 1}.pdf) ===" in merge_prompt
+        assert f"{len(prompt(shard_request))}-character prompt" in merge_prompt
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_schema_call_returns_the_model_record(server, replies, pdfs, use_async):
+    replies.script = lambda request: json.dumps({"name": "Jane Doe", "annual_income": 52000})
+    tool = PDFQATool(output_schemas={"applicant": Applicant}, model_tiers=[])
+    result = run(tool, use_async, paths=pdfs[:2], schema_name="applicant")
+    assert Applicant.model_validate_json(result) == Applicant(name="Jane Doe", annual_income=52000)
+    response_format = replies[0]["response_format"]
+    assert response_format["type"] == "json_schema"
+    # Required fields may come back null, so a missing value fails validation instead of being invented
+    assert {"type": "null"} in response_format["json_schema"]["schema"]["properties"]["name"]["anyOf"]
+
+
+def test_missing_required_values_fail_after_every_tier_and_retry(server, replies, pdfs):
+    replies.script = lambda request: json.dumps({"name": None, "annual_income": 52000})
+    tool = PDFQATool(model_tiers=["mistral-small-latest"], max_validation_retries=1)
+    with pytest.raises(ValueError, match="name"):
+        tool.extract(pdfs[:1], Applicant)
+    # Lower tier once, then the main model and one retry told what was wrong
+    assert [request["model"] for request in replies] == ["mistral-small-latest", tool.model, tool.model]
+    assert "name" in prompt(replies[-1])
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_tripped_breaker_answers_offline(server, replies, pdfs, use_async):
+    breaker = get_scheduler().breaker
+    breaker.trip()
+    try:
+        answer = run(PDFQATool(), use_async, paths=pdfs[:1], question=f"What is the loan amount ({use_async})?")
+    finally:
+        breaker.record_success()
+    assert answer.startswith("The document QA service is currently unavailable")
+    assert "What is the loan amount" in answer
+    assert replies == []
+    assert metrics.counter("pdfqa.fallback.offline_answers") == 1
+
+
+def test_identical_concurrent_calls_are_coalesced(server, replies, pdfs):
+    server.settings.latency = 0.2
+    tool = PDFQATool(model_tiers=[])
+
+    async def both():
+        return await asyncio.gather(*[tool._arun(paths=pdfs[:2], question="What is the address?") for _ in range(2)])
+
+    try:
+        first, second = asyncio.run(both())
+    finally:
+        server.settings.latency = 0.0
+    assert first == second
+    assert len(replies) == 1
+    assert metrics.counter("pdfqa.singleflight.executed") == 1
+    assert metrics.counter("pdfqa.singleflight.coalesced") == 1
+
+
+def test_unchanged_pages_of_a_new_version_are_not_ocred_again(server, replies, tmp_path):
+    widths = [next(_widths) for _ in range(4)]
+    tool = PDFQATool(use_text_layer=False, model_tiers=[])
+    tool._run(paths=[write_pdf(tmp_path / "v1.pdf", widths)], question="What is the balance?")
+    assert metrics.counter("pdfqa.ocr.pages") == 4
+
+    # v2 changes the third page only
+    edited = widths[:2] + [next(_widths)] + widths[3:]
+    tool._run(paths=[write_pdf(tmp_path / "v2.pdf", edited)], question="What is the balance?")
+    assert metrics.counter("pdfqa.ocr.pages_reused") == 3
+    assert metrics.counter("pdfqa.ocr.pages") == 5
+
+
+def test_identical_files_are_processed_once(server, replies, tmp_path):
+    original = write_pdf(tmp_path / "payslip.pdf", pages=2)
+    copy = str(shutil.copy(original, tmp_path / "payslip (1).pdf"))
+    tool = PDFQATool(model_tiers=[])
+
+    answer = tool._run(paths=[original, copy], question="What is the net pay?")
+    assert answer.endswith(json.dumps({original: [copy]}, indent=2))
+    assert metrics.counter("pdfqa.documents.deduplicated") == 1
+    assert metrics.counter("pdfqa.ocr.count") == 1
+    assert prompt(replies[0]).count("payslip") == 1
+
+    # Structured results stay valid JSON; the mapping is left out of them
+    batch = json.loads(tool._run(paths=[original, copy], questions=["Employer?", "Pay date?"]))
+    assert set(batch) == {"Employer?", "Pay date?"}
+    assert metrics.recent_calls()[-1]["duplicates"] == {original: [copy]}